@@ -34,6 +34,9 @@ setup(name='vocal',
           'dev': [
               'pycodestyle==2.6.0',
           ],
+          'uvloop': [
+              'uvloop',
+          ],
       },
       entry_points={
           'console_scripts': [
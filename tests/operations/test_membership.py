@@ -3,6 +3,7 @@ from decimal import Decimal
 import vocal.api.operations as op
 from vocal.api.models.membership import PaymentDemandType, PaymentDemandPeriod,\
     SubscriptionPlan
+from vocal.api.storage.page import PageRequest
 
 from .. import DatabaseTestCase
 
@@ -75,3 +76,86 @@ class MembershipOperationsTestCase(DatabaseTestCase):
             p = plans[0]
             assert len(plans) == 1
             assert len(p.payment_demands) == 4
+
+    async def test_batch_execute(self):
+        async with op.session(self.appctx) as ss:
+            plan_ids = []
+            for rank in (1, 2):
+                plan_id = await op.membership.create_subscription_plan(
+                    rank=rank,
+                    name=f"Plan {rank}",
+                    description="- Ad-free podcast episodes\n",
+                    payment_demands=(
+                        (PaymentDemandType.Periodic, PaymentDemandPeriod.Monthly,
+                         Decimal('10.0'), 'USD'),)).\
+                    execute(ss)
+                plan_ids.append(plan_id)
+
+        results = await op.execute(self.appctx, [
+            op.membership.get_subscription_plan(subscription_plan_id=plan_ids[1]),
+            op.membership.get_subscription_plans(),
+            op.membership.get_subscription_plan(subscription_plan_id=plan_ids[0]),
+        ], batch=True)
+
+        assert len(results) == 3
+        assert results[0][0].subscription_plan_id == plan_ids[1]
+        assert len(results[1]) == 2
+        assert results[2][0].subscription_plan_id == plan_ids[0]
+
+    async def test_stream_plans(self):
+        async with op.session(self.appctx) as ss:
+            for rank in (1, 2):
+                await op.membership.create_subscription_plan(
+                    rank=rank,
+                    name=f"Plan {rank}",
+                    description="- Ad-free podcast episodes\n",
+                    payment_demands=(
+                        (PaymentDemandType.Periodic, PaymentDemandPeriod.Monthly,
+                         Decimal('10.0'), 'USD'),
+                        (PaymentDemandType.Immediate, Decimal('100.0'), 'USD'))).\
+                    execute(ss)
+
+            groups = [g async for g in op.membership.get_subscription_plans().stream(ss)]
+            plans = [p async for p in op.membership.
+                     get_subscription_plans().
+                     unmarshal_with(SubscriptionPlan).
+                     stream(ss)]
+
+        assert len(groups) == 2
+        assert all(len(g) == 2 for g in groups)
+        assert len(plans) == 2
+        assert [p.subscription_plan_id for p in plans] ==\
+                [g[0].subscription_plan_id for g in groups]
+        assert all(len(p.payment_demands) == 2 for p in plans)
+
+    async def test_page_plans(self):
+        async with op.session(self.appctx) as ss:
+            for rank in (1, 2, 3):
+                await op.membership.create_subscription_plan(
+                    rank=rank,
+                    name=f"Plan {rank}",
+                    description="- Ad-free podcast episodes\n",
+                    payment_demands=(
+                        (PaymentDemandType.Periodic, PaymentDemandPeriod.Monthly,
+                         Decimal('10.0'), 'USD'),
+                        (PaymentDemandType.Immediate, Decimal('100.0'), 'USD'))).\
+                    execute(ss)
+
+            first = await op.membership.\
+                get_subscription_plans(page=PageRequest(size=2)).\
+                unmarshal_with(SubscriptionPlan).\
+                execute(ss)
+            assert len(first) == 2
+            assert first.page.next_page is not None
+
+            second = await op.membership.\
+                get_subscription_plans(page=PageRequest(size=2, token=first.page.next_page)).\
+                unmarshal_with(SubscriptionPlan).\
+                execute(ss)
+            assert len(second) == 1
+            assert second.page.page == first.page.next_page
+            assert second.page.next_page is None
+            assert all(len(p.payment_demands) == 2 for p in [*first, *second])
+
+            ids = {p.subscription_plan_id for p in [*first, *second]}
+            assert len(ids) == 3
@@ -1,3 +1,22 @@
+import json
+from uuid import uuid4
+from unittest import TestCase as BaseTestCase
+
+import aiohttp_session
+from aiohttp.test_utils import AioHTTPTestCase
+from aiohttp.web import Application, HTTPNotFound
+
+import vocal.api.cache as cache
+import vocal.api.security as security
+from vocal.api.message import VectorResultMessage
+from vocal.api.models.authn import AuthnChallengeType
+from vocal.api.pipeline import error_middleware, inject, pipeline
+from vocal.api.util import OkStatus
+from vocal.api.security import AuthnSession, LazySession
+from vocal.config import AppConfig
+from vocal.constants import UserRole
+from vocal.util import json as vocal_json
+
 from . import AppTestCase
 
 
@@ -6,3 +25,266 @@ class TestCase(AppTestCase):
         "tests only that the app is mounted, handles requests, produces a response"
         resp = await self.client.request('GET', '/')
         assert resp.status == 404
+
+
+class InjectTestCase(BaseTestCase):
+    def test_inject_leaves_annotations(self):
+        @security.new_session
+        async def handler(request, ctx: AppConfig, session: AuthnSession):
+            pass
+
+        annotations = dict(handler.__annotations__)
+        inject(AppConfig(), handler)
+        inject(AppConfig(), handler)
+        assert handler.__annotations__ == annotations
+
+    def test_inject_unknown_annotation(self):
+        async def handler(request, foo: int):
+            pass
+
+        with self.assertRaises(RuntimeError):
+            inject(AppConfig(), handler)
+
+
+class LazySessionTestCase(AioHTTPTestCase):
+    async def get_application(self):
+        class CountingStorage(security.SimpleCookieStorage):
+            loads = 0
+            saves = 0
+
+            async def load_session(self, request):
+                CountingStorage.loads += 1
+                return await super().load_session(request)
+
+            async def save_session(self, request, response, session):
+                CountingStorage.saves += 1
+                return await super().save_session(request, response, session)
+        self.storage = CountingStorage
+
+        async def untouched(request, session: LazySession):
+            return {'loaded': session.loaded}
+
+        @security.requires(security.Capability.ProfileList)
+        async def required(request, session: AuthnSession):
+            return {}
+
+        async def read(request, session: LazySession):
+            await session.load()
+            return {'authenticated': session.authenticated}
+
+        async def written(request, session: LazySession):
+            await session.load()
+            session.authenticated = True
+            return {}
+
+        async def loaded(request, session: AuthnSession):
+            return {'authenticated': session.authenticated}
+
+        storage = CountingStorage(encoder=vocal_json.encode)
+        app = Application(middlewares=[aiohttp_session.session_middleware(storage)])
+        for handler in (untouched, required, read, written, loaded):
+            app.router.add_get(f'/{handler.__name__}', pipeline(AppConfig(), handler))
+        return app
+
+    async def test_lazy_session(self):
+        resp = await self.client.request('GET', '/untouched')
+        assert (await resp.json())['data'] == {'loaded': False}
+        assert (self.storage.loads, self.storage.saves) == (0, 0)
+
+        resp = await self.client.request('GET', '/required')
+        assert resp.status == 403
+        assert (self.storage.loads, self.storage.saves) == (1, 0)
+
+        resp = await self.client.request('GET', '/read')
+        assert (await resp.json())['data'] == {'authenticated': False}
+        assert (self.storage.loads, self.storage.saves) == (2, 0)
+
+        resp = await self.client.request('GET', '/written')
+        assert resp.status == 200
+        assert (self.storage.loads, self.storage.saves) == (3, 1)
+
+        # the session written above is read without the handler loading it
+        resp = await self.client.request('GET', '/loaded')
+        assert (await resp.json())['data'] == {'authenticated': True}
+        assert (self.storage.loads, self.storage.saves) == (4, 1)
+
+
+class AuthnSessionTestCase(BaseTestCase):
+    def test_restore(self):
+        session = AuthnSession(None, data=None, new=True)
+        session.user_profile_id = uuid4()
+        session.require_challenge(AuthnChallengeType.Email)
+
+        restored = AuthnSession.restore('key', session.created, session._mapping)
+        assert restored.identity == 'key'
+        assert not restored.new
+        assert restored.user_profile_id == session.user_profile_id
+        restored.required_challenges.pop()
+        assert session.required_challenges == [AuthnChallengeType.Email]
+
+        expired = AuthnSession.restore('key', session.created - 61, session._mapping, max_age=60)
+        assert expired.new
+        assert expired.identity is None
+
+
+class CapabilityTestCase(BaseTestCase):
+    def test_capabilities(self):
+        session = AuthnSession(None, data=None, new=True)
+        session.add_capabilities(security.Capability.Authenticate)
+        assert session.has_capabilities(security.Capability.Authenticate)
+        assert not session.has_capabilities(security.Capability.Authenticate,
+                                            security.Capability.ProfileList)
+
+        session.set_role(UserRole.Member)
+        assert set(session.capabilities) == security.RoleCapability[UserRole.Member]
+        assert not session.has_capabilities(security.Capability.Authenticate)
+        assert session.has_capabilities()
+
+        session.remove_capabilities(security.Capability.ProfileList)
+        assert list(session.capabilities) == [security.Capability.PaymentMethodCreate]
+        assert vocal_json.encode(session.capabilities) == '["payment_method.create"]'
+        assert security.CapabilitySet.unmarshal(['payment_method.create']) ==\
+            session.capabilities
+
+
+class StreamTestCase(AioHTTPTestCase):
+    async def get_application(self):
+        async def items(request):
+            async def f():
+                for i in range(int(request.query['n'])):
+                    yield {'i': i, 'pad': 'x' * 1000}
+            return f()
+
+        async def missing(request):
+            async def f():
+                raise HTTPNotFound()
+                yield
+            return f()
+
+        async def version(request, appctx):
+            return 1
+
+        @cache.conditional(cache_control='no-cache', version=version)
+        async def versioned(request):
+            return await items(request)
+
+        app = Application()
+        app.router.add_get('/items', pipeline(AppConfig(), items))
+        app.router.add_get('/missing', pipeline(AppConfig(), missing))
+        app.router.add_get('/versioned', pipeline(AppConfig(), versioned))
+        return app
+
+    async def test_stream(self):
+        for n in (0, 1, 200):
+            resp = await self.client.request('GET', '/items', params={'n': n})
+            assert resp.status == 200
+            assert resp.headers['Transfer-Encoding'] == 'chunked'
+            body = await resp.read()
+            data = [{'i': i, 'pad': 'x' * 1000} for i in range(n)]
+            assert body == vocal_json.encode_bytes(VectorResultMessage(status=OkStatus,
+                                                                       data=data))
+            assert json.loads(body)['data'] == data
+
+    async def test_stream_versioned(self):
+        resp = await self.client.request('GET', '/versioned', params={'n': 2})
+        assert resp.headers['Transfer-Encoding'] == 'chunked'
+        assert resp.headers['Cache-Control'] == 'no-cache'
+        assert len((await resp.json())['data']) == 2
+
+        resp = await self.client.request('GET', '/versioned', params={'n': 2},
+                                         headers={'If-None-Match': resp.headers['ETag']})
+        assert resp.status == 304
+
+    async def test_stream_error(self):
+        resp = await self.client.request('GET', '/missing')
+        assert resp.status == 404
+        assert (await resp.json())['status']['success'] is False
+
+
+class ErrorMiddlewareTestCase(AioHTTPTestCase):
+    async def get_application(self):
+        async def items(request):
+            return []
+
+        app = Application(middlewares=[error_middleware])
+        app.router.add_get('/items', pipeline(AppConfig(), items))
+        return app
+
+    async def test_unknown_path(self):
+        resp = await self.client.request('GET', '/nope')
+        assert resp.status == 404
+        assert resp.content_type == 'application/json'
+        status = (await resp.json())['status']
+        assert status['success'] is False
+        assert status['message'] == 'Not Found'
+        assert status['errors']
+
+    async def test_wrong_method(self):
+        resp = await self.client.request('POST', '/items')
+        assert resp.status == 405
+        assert resp.content_type == 'application/json'
+        assert 'GET' in resp.headers['Allow']
+        status = (await resp.json())['status']
+        assert status['success'] is False
+        assert status['message'] == 'Method Not Allowed'
+
+
+class ConditionalTestCase(AioHTTPTestCase):
+    async def get_application(self):
+        self.version = 1
+        self.calls = 0
+
+        async def version(request, appctx):
+            return self.version
+
+        @cache.conditional(cache_control='no-cache', version=version)
+        async def versioned(request):
+            self.calls += 1
+            return {'version': self.version}
+
+        @cache.conditional()
+        async def hashed(request):
+            return {'q': request.query.get('q')}
+
+        app = Application()
+        app.router.add_get('/versioned', pipeline(AppConfig(), versioned))
+        app.router.add_get('/hashed', pipeline(AppConfig(), hashed, cache_control='max-age=60'))
+        return app
+
+    async def test_versioned(self):
+        resp = await self.client.request('GET', '/versioned')
+        assert resp.status == 200
+        assert resp.headers['Cache-Control'] == 'no-cache'
+        tag = resp.headers['ETag']
+
+        resp = await self.client.request('GET', '/versioned', headers={'If-None-Match': tag})
+        assert resp.status == 304
+        assert resp.headers['ETag'] == tag
+        assert self.calls == 1
+
+        self.version = 2
+        resp = await self.client.request('GET', '/versioned',
+                                         headers={'If-None-Match': f'"x", W/{tag}'})
+        assert resp.status == 200
+        assert (await resp.json())['data'] == {'version': 2}
+
+    async def test_hashed(self):
+        resp = await self.client.request('GET', '/hashed', params={'q': 'a'})
+        assert resp.headers['Cache-Control'] == 'max-age=60'
+        tag = resp.headers['ETag']
+
+        resp = await self.client.request('GET', '/hashed', params={'q': 'a'},
+                                         headers={'If-None-Match': tag})
+        assert resp.status == 304
+        resp = await self.client.request('GET', '/hashed', params={'q': 'b'},
+                                         headers={'If-None-Match': tag})
+        assert resp.status == 200
+
+    def test_versioned_requires_session(self):
+        @security.requires(security.Capability.PlanCreate)
+        @cache.conditional(version=lambda request, appctx: None)
+        async def handler(request):
+            pass
+
+        with self.assertRaises(RuntimeError):
+            pipeline(AppConfig(), handler)
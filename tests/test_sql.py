@@ -4,6 +4,9 @@ from datetime import datetime, timedelta
 
 import sqlalchemy.ext.asyncio
 from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.sql.expression import literal, select
+
+import vocal.api.storage as storage
 
 from vocal.api.storage.sql import user_profile, contact_method, phone_contact_method,\
         email_contact_method, payment_demand, payment_profile, payment_method, subscription_plan,\
@@ -156,3 +159,44 @@ class SqlTestCase(DatabaseTestCase):
                     where(payment_demand.c.payment_demand_id == self.payment_demand_id)
                 await ss.execute(q)
         assert '[PAYMENT_DEMAND_HAS_SUBSCRIBERS]' in str(exc_info.value)
+
+    async def test_pool_status(self):
+        status = storage.pool_status(self.engine)
+        assert status.size == 5
+        assert status.checked_out == 0
+        assert status.acquired >= 1
+
+        async with self.get_session() as ss:
+            await ss.execute(select(literal(True)))
+            status = storage.pool_status(self.engine)
+            assert status.checked_out == 1
+            assert status.waiting == 0
+
+    async def test_replica_routing(self):
+        replicas = storage.ReplicaSet([self.engine])
+        async with self.get_session() as ss:
+            async with storage.replica.routing(replicas, ss):
+                reader = await storage.replica.reader(ss)
+                assert reader is not ss
+                assert await storage.replica.reader(ss) is reader
+
+                storage.replica.mark_written(ss)
+                assert await storage.replica.reader(ss) is ss
+
+        replicas.mark_down(self.engine)
+        assert replicas.choose() is None
+        async with self.get_session() as ss:
+            async with storage.replica.routing(replicas, ss):
+                assert await storage.replica.reader(ss) is ss
+
+    async def test_prewarm(self):
+        await storage.prewarm(self.engine, 3)
+        status = storage.pool_status(self.engine)
+        assert status.idle >= 3
+        assert status.checked_out == 0
+
+        # an unreachable database is logged, the pool connects on demand later
+        unreachable = storage.create_engine({'host': 'localhost', 'port': 1, 'database': 'x'},
+                                            self.appctx.config.get()['secrets']['storage'], {})
+        await storage.prewarm(unreachable, 1)
+        await unreachable.dispose()
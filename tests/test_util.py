@@ -1,7 +1,38 @@
-from datetime import date, datetime, timedelta
+import asyncio
+import multiprocessing
+import os
+import signal
+import tempfile
+import time
+from collections import namedtuple
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
+from pathlib import Path
 from unittest import TestCase
+from uuid import uuid4
 
-from vocal.util import dates
+from aiohttp.test_utils import make_mocked_request
+from aioredis import Redis
+
+from vocal.api.message import Page, PaginationStatus
+from vocal.api.models.base import ViewModel, model_collection
+from vocal.api.models.authn import AuthnChallenge
+from vocal.api.models.user_profile import PaymentMethod, PaymentProfile
+from vocal.api.security import AuthnSession, Capability, RedisStorage
+from vocal.api.session_codec import BinaryCodec, JsonCodec
+from vocal.api.storage.record import BaseRecord, Recordset
+from vocal.api.util import envelope
+from vocal.constants import AuthnChallengeType
+from vocal.api.validation import RequestBodies
+from vocal.util import dates, json
+from vocal.util.asyncio import install_loop_policy
+from vocal.util.prefork import Supervisor
+from vocal.cli import reload_context
+from vocal.config import AppConfig
+from vocal.util.schema import SchemaError, compile_schema
+from vocal.util.indexed import IndexedSequence
+from vocal.util.lru import LRUCache
 
 
 class UtilTestCase(TestCase):
@@ -138,3 +169,359 @@ class UtilTestCase(TestCase):
         assert dates.add_months(d, 16).day == 29
         assert dates.add_months(d, 17).day == 29
         assert dates.add_months(d, 18).day == 29
+
+    def test_indexed_sequence(self):
+        Item = namedtuple('Item', ['kind', 'color', 'tags'])
+        items = IndexedSequence([Item('a', 'red', ['x']),
+                                 Item('a', 'blue', ['y']),
+                                 Item('b', 'red', ['x'])])
+
+        assert items.find(kind='a', color='red') is items[0]
+        assert items.find(kind='b', color='blue') is None
+        assert items.find_all(color='red') == [items[0], items[2]]
+        assert items.find_all(tags=['x']) == [items[0], items[2]]
+        assert items.find(lambda i: i.color == 'blue') is items[1]
+        assert list(items.group_by('kind')) == ['a', 'b']
+
+        items.append(Item('b', 'blue', []))
+        assert items.find(kind='b', color='blue') is items[3]
+        assert len(items.group_by('kind')['b']) == 2
+
+    def test_view_serializer(self):
+        pm = PaymentMethod(payment_method_id=uuid4(), processor_payment_method_id='pm_1',
+                           payment_method_type='credit_card', payment_method_family='visa',
+                           display_name='Visa', safe_account_number_fragment='4242',
+                           status='current', expires_after=datetime(2030, 1, 1))
+        prof = PaymentProfile(user_profile_id=uuid4(), payment_profile_id=uuid4(),
+                              processor_id='stripe', processor_customer_profile_id='cus_1',
+                              payment_methods=model_collection([pm]))
+
+        view = prof.get_view('public')
+        assert list(view) == ['payment_profile_id', 'processor_id', 'payment_methods']
+        assert view['payment_methods'] == [{k: v for k, v in pm.marshal_dict().items()
+                                            if k != 'processor_payment_method_id'}]
+        assert prof.get_view('public') == view
+        assert prof.get_view('default') == {**prof.marshal_dict(),
+                                            'payment_methods': [pm.marshal_dict()]}
+
+        pm_view = pm.get_view('public')
+        pm_view['display_name'] = 'changed'
+        assert pm.get_view('public')['display_name'] == 'Visa'
+
+        pm2 = PaymentMethod(**{**pm.marshal_dict(), 'payment_method_id': uuid4()})
+        prof.payment_methods.append(pm2)
+        assert len(prof.payment_methods.get_view('public')) == 2
+        assert [m['payment_method_id'] for m in prof.get_view('public')['payment_methods']] ==\
+            [pm.payment_method_id, pm2.payment_method_id]
+
+    def test_json_records(self):
+        class PointRecord(BaseRecord):
+            x: int
+            y: int
+
+        class OtherRecord(BaseRecord):
+            x: int
+            y: int
+
+        recs = [PointRecord(1, 2), PointRecord(x=3, y=4)]
+        dicts = [{'x': 1, 'y': 2}, {'x': 3, 'y': 4}]
+        paged = PaginationStatus(size=2, page=None, next_page='t')
+        for resp, data in ((recs, dicts),
+                           (Recordset(recs), dicts),
+                           ({'a': recs[0], 'b': 1}, {'a': dicts[0], 'b': 1}),
+                           (Page(recs, paged), dicts),
+                           (Recordset(recs, page=paged), dicts)):
+            assert envelope(resp).data == data
+        assert '"data": [{"x": 1, "y": 2}, {"x": 3, "y": 4}]' in json.encode(envelope(recs))
+
+        plain = [{'x': 1}]
+        assert envelope(plain).data is plain
+
+        @dataclass(frozen=True)
+        class Holder(ViewModel):
+            rec: PointRecord
+
+        assert Holder(recs[0]).get_view('default') == {'rec': dicts[0]}
+
+        assert PointRecord(1, 2) == PointRecord(1, 2)
+        assert PointRecord(1, 2) != OtherRecord(1, 2)
+        assert PointRecord(1, 2) != (1, 2)
+        assert len({PointRecord(1, 2), OtherRecord(1, 2), PointRecord(1, 2)}) == 2
+
+    def test_compile_schema(self):
+        validate = compile_schema({
+            'type': 'object',
+            'required': ['id'],
+            'additionalProperties': False,
+            'properties': {
+                'id': {'type': 'string', 'format': 'uuid'},
+                'name': {'type': 'string', 'nullable': True, 'maxLength': 3},
+                'items': {'type': 'array', 'items': {'$ref': '#/Item'}},
+            },
+        }, resolve=lambda ref: {'oneOf': [{'type': 'integer', 'minimum': 1},
+                                          {'type': 'string', 'enum': ['a', 'b']}]})
+
+        id = uuid4()
+        doc = {'id': str(id), 'name': None, 'items': [1, 'a']}
+        assert validate(doc) == {'id': id, 'name': None, 'items': [1, 'a']}
+        assert doc['id'] == str(id)
+
+        for doc, error in (([], "expected an object"),
+                           ({}, "id: is required"),
+                           ({'id': 'x'}, "id: not a valid uuid"),
+                           ({'id': str(uuid4()), 'items': [{}]}, "items.0: matches none"),
+                           ({'id': str(uuid4()), 'items': [['a']]}, "items.0: matches none"),
+                           ({'id': str(uuid4()), 'name': 'abcd'}, "name: longer than 3"),
+                           ({'id': str(uuid4()), 'items': [0]}, "items.0: matches none"),
+                           ({'id': str(uuid4()), 'other': 1}, "other: is not allowed")):
+            with self.assertRaises(SchemaError) as cm:
+                validate(doc)
+            assert str(cm.exception).startswith(error)
+
+    def test_request_bodies(self):
+        bodies = RequestBodies('openapi/requestBodies.yaml')
+        ids = {'paymentMethodId': uuid4(), 'subscriptionPlanId': uuid4(),
+               'paymentDemandId': uuid4()}
+        assert bodies.validator('CreateSubscriptionRequest')(
+            {k: str(v) for k, v in ids.items()}) == ids
+
+        validate = bodies.validator('CreateSubscriptionPlanRequest')
+        plan = validate({'description': "plan",
+                  'payment_demands': [{'demand_type': 'periodic', 'period': 'monthly',
+                                       'amount': '10.0', 'iso_currency': 'USD'},
+                                      {'demand_type': 'immediate', 'amount': 25}]})
+        assert [pd['amount'] for pd in plan['payment_demands']] == [Decimal('10.0'), 25]
+        assert plan['payment_demands'][0]['period'] == 'monthly'
+        with self.assertRaises(ValueError):
+            validate({'description': "plan",
+                      'payment_demands': [{'demand_type': 'periodic', 'amount': '10.0'}]})
+
+    def test_prefork_supervisor(self):
+        def alive(pid):
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                return False
+            return True
+
+        def wait_for(cond):
+            deadline = time.monotonic() + 10
+            while not cond():
+                assert time.monotonic() < deadline
+                time.sleep(0.05)
+
+        with tempfile.TemporaryDirectory() as d:
+            def worker(ready):
+                (Path(d) / str(os.getpid())).touch()
+                ready()
+                while True:
+                    time.sleep(1)
+
+            def started():
+                return [int(p.name) for p in Path(d).iterdir()]
+
+            supervisor = Supervisor(worker, 2, restart_delay=0.1)
+            proc = multiprocessing.get_context('fork').Process(target=supervisor.run)
+            proc.start()
+            try:
+                wait_for(lambda: len(started()) == 2)
+                first = started()
+
+                os.kill(first[0], signal.SIGKILL)
+                wait_for(lambda: len(started()) == 3)
+                wait_for(lambda: not alive(first[0]))
+
+                before = set(started())
+                os.kill(proc.pid, signal.SIGHUP)
+                wait_for(lambda: len(started()) == 5)
+                wait_for(lambda: not any(alive(p) for p in before))
+                assert all(alive(p) for p in set(started()) - before)
+            finally:
+                os.kill(proc.pid, signal.SIGTERM)
+                proc.join(10)
+
+            assert proc.exitcode == 0
+            assert not any(alive(p) for p in started())
+
+    def test_prefork_reload_config(self):
+        def wait_for(cond):
+            deadline = time.monotonic() + 10
+            while not cond():
+                assert time.monotonic() < deadline
+                time.sleep(0.05)
+
+        with tempfile.TemporaryDirectory() as d:
+            conf = Path(d) / 'config' / 'test'
+            conf.mkdir(parents=True)
+            (conf / 'logging.yaml').write_text('version: 1\n')
+            (conf / 'app.yaml').write_text('name: first\n')
+            seen = Path(d) / 'seen'
+            seen.mkdir()
+
+            appctx = AppConfig('debug', 'config', 'module', 'config_source')
+            appctx.debug.set(False)
+            appctx.module.set(None)
+            appctx.config_source.set((Path(d) / 'config', 'test'))
+
+            def worker(ready):
+                workerctx = asyncio.run(reload_context(appctx))
+                (seen / str(os.getpid())).write_text(workerctx.config.get()['app']['name'])
+                ready()
+                while True:
+                    time.sleep(1)
+
+            def names():
+                return sorted(p.read_text() for p in seen.iterdir())
+
+            supervisor = Supervisor(worker, 2, restart_delay=0.1)
+            proc = multiprocessing.get_context('fork').Process(target=supervisor.run)
+            proc.start()
+            try:
+                wait_for(lambda: len(names()) == 2)
+                assert names() == ['first', 'first']
+
+                (conf / 'app.yaml').write_text('name: second\n')
+                os.kill(proc.pid, signal.SIGHUP)
+                wait_for(lambda: len(names()) == 4)
+                assert names() == ['first', 'first', 'second', 'second']
+            finally:
+                os.kill(proc.pid, signal.SIGTERM)
+                proc.join(10)
+            assert proc.exitcode == 0
+
+    def test_install_loop_policy(self):
+        try:
+            import uvloop
+        except ImportError:
+            uvloop = None
+
+        try:
+            assert install_loop_policy('uvloop') == ('uvloop' if uvloop else 'asyncio')
+            loop = asyncio.new_event_loop()
+            assert isinstance(loop, uvloop.Loop) if uvloop else True
+            loop.close()
+        finally:
+            assert install_loop_policy('asyncio') == 'asyncio'
+
+        with self.assertRaises(ValueError):
+            install_loop_policy('trio')
+
+    def test_lru_cache(self):
+        cache = LRUCache(2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        assert cache.get('a') == 1
+        cache.set('c', 3)
+        assert cache.get('b') is None
+        assert (cache.get('a'), cache.get('c')) == (1, 3)
+        assert cache.pop('a') == 1
+        assert len(cache) == 1
+
+        cache = LRUCache(2, ttl=0)
+        cache.set('a', 1)
+        assert cache.get('a', 'expired') == 'expired'
+        assert len(cache) == 0
+
+    def test_session_codec(self):
+        session = AuthnSession(None, data=None, new=True)
+        session.user_profile_id = uuid4()
+        session.add_capabilities(Capability.ProfileList, Capability.PlanCreate)
+        session.require_challenge(AuthnChallengeType.Email)
+        session.require_challenge(AuthnChallengeType.Password)
+        session._mapping['pending_challenge'] = AuthnChallenge(
+            challenge_id=uuid4(), challenge_type=AuthnChallengeType.SMS, hint='***-1234',
+            secret='123456', attempts=2)
+        data = {'created': session.created, 'session': session._mapping}
+
+        codec = BinaryCodec()
+        stored = codec.encode(data)
+        legacy = JsonCodec().encode(data)
+        assert len(stored) < len(legacy) / 3
+
+        for c, b in ((codec, stored), (codec, legacy), (JsonCodec(), stored)):
+            created, mapping = c.decode(b)
+            assert created == session.created
+            assert set(mapping.pop('capabilities')) == {Capability.ProfileList,
+                                                        Capability.PlanCreate}
+            assert mapping == {k: v for k, v in session._mapping.items() if k != 'capabilities'}
+
+        assert codec.decode(codec.encode({})) is None
+        extra = {'created': session.created, 'session': {**session._mapping, 'extra': 1}}
+        assert codec.encode(extra) == JsonCodec().encode(extra)
+
+        for invalid in (stored[:-1], stored + b'\0', b'\x02' + stored[1:], b'{"foo": 1}',
+                        b'{"created": 1, "session": {}}', b'{"created": 1, "session": 2}'):
+            with self.assertRaises(ValueError):
+                codec.decode(invalid)
+
+    def test_resubscribe(self):
+        class Channel(object):
+            def __init__(self):
+                self.messages = asyncio.Queue()
+
+            async def iter(self):
+                while (message := await self.messages.get()) is not None:
+                    yield message
+
+        channels = []
+
+        async def connect():
+            if len(channels) == 1:
+                channels.append(None)
+                raise ConnectionRefusedError()
+            channels.append(Channel())
+            return Conn()
+
+        class Conn(object):
+            async def subscribe(self, name):
+                assert name == storage.invalidation_channel
+                return channels[-1],
+
+            def close(self):
+                pass
+
+        async def settle():
+            for _ in range(10):
+                await asyncio.sleep(0)
+
+        storage = RedisStorage(Redis(None), codec=JsonCodec(), cache=LRUCache(10, 60))
+        storage.resubscribe_delay = 0
+
+        async def run():
+            await storage.subscribe(connect)
+            await settle()
+            assert storage._listening
+            storage._cache.set('a', 1)
+            storage._cache.set('b', 2)
+            channels[0].messages.put_nowait(b'other:a')
+            channels[0].messages.put_nowait(f'{storage._origin}:b'.encode('utf-8'))
+            await settle()
+            assert storage._cache.get('a') is None
+            assert storage._cache.get('b') == 2
+
+            # the channel drops, the first reconnection is refused, and the second resubscribes
+            with self.assertLogs('vocal.api.security', 'WARNING') as logs:
+                channels[0].messages.put_nowait(None)
+                await settle()
+            assert len(logs.records) == 2
+            assert len(channels) == 3
+            assert storage._listening
+            assert len(storage._cache) == 0
+
+            await storage.close()
+            assert not storage._listening
+
+        asyncio.run(run())
+
+    def test_load_invalid_session(self):
+        class Pool(object):
+            async def execute(self, command, key, **kwargs):
+                return stored
+
+        storage = RedisStorage(Redis(Pool()), codec=JsonCodec())
+        request = make_mocked_request('GET', '/',
+                                      headers={'Cookie': f'{storage.cookie_name}=abc'})
+        for stored in (b'{"foo": 1}', b'{"created": 1, "session": {}}', b'[1]', b'{'):
+            session = asyncio.run(storage.load_session(request))
+            assert session.identity == 'abc'
+            assert not session.authenticated
@@ -32,9 +32,18 @@ class PlansViewTestCase(AppTestCase):
         resp = await self.client.request('GET', '/plans')
         j = await resp.json()
         assert resp.status == 200
+        assert resp.headers['Transfer-Encoding'] == 'chunked'
+        assert 'ETag' in resp.headers
 
         plans = j['data']
         assert len(plans) == 1
+        assert 'page' not in j
+
+        resp = await self.client.request('GET', '/plans', params={'page_size': 1})
+        paged = await resp.json()
+        assert resp.status == 200
+        assert paged['data'] == plans
+        assert paged['page'] == {'size': 1, 'page': None, 'next_page': None}
 
         plan = plans[0]
         assert len(plan['payment_demands']) == 4
@@ -43,6 +52,55 @@ class PlansViewTestCase(AppTestCase):
         assert len([pd for pd in pds if pd['demand_type'] == 'immediate']) == 1
         assert len([pd for pd in pds if pd['demand_type'] == 'periodic']) == 3
 
+    async def test_get_plans_after_write(self):
+        resp = await self.client.request('GET', '/plans')
+        j = await resp.json()
+        assert resp.status == 200
+        assert len(j['data']) == 0
+
+        async with op.session(self.appctx) as ss:
+            await op.membership.create_subscription_plan(
+                rank=1,
+                name="Basic member",
+                description="- Ad-free podcast episodes\n",
+                payment_demands=(
+                    (PaymentDemandType.Periodic, PaymentDemandPeriod.Monthly,
+                     Decimal('10.0'), 'USD'),)).\
+                execute(ss)
+
+        resp = await self.client.request('GET', '/plans')
+        j = await resp.json()
+        assert resp.status == 200
+        assert len(j['data']) == 1
+
+    async def test_get_plans_not_modified(self):
+        resp = await self.client.request('GET', '/plans')
+        assert resp.status == 200
+        tag = resp.headers['ETag']
+        assert resp.headers['Cache-Control'] == 'no-cache'
+
+        resp = await self.client.request('GET', '/plans', headers={'If-None-Match': tag})
+        assert resp.status == 304
+        assert resp.headers['ETag'] == tag
+
+        resp = await self.client.request('GET', '/plans', params={'page_size': 1},
+                                         headers={'If-None-Match': tag})
+        assert resp.status == 200
+
+        async with op.session(self.appctx) as ss:
+            await op.membership.create_subscription_plan(
+                rank=1,
+                name="Basic member",
+                description="- Ad-free podcast episodes\n",
+                payment_demands=(
+                    (PaymentDemandType.Periodic, PaymentDemandPeriod.Monthly,
+                     Decimal('10.0'), 'USD'),)).\
+                execute(ss)
+
+        resp = await self.client.request('GET', '/plans', headers={'If-None-Match': tag})
+        assert resp.status == 200
+        assert resp.headers['ETag'] != tag
+
     async def test_create_plan(self):
         await self.authenticate_as(UserRole.Superuser)
         data = {
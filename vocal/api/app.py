@@ -1,30 +1,45 @@
 import aioredis
 import aiohttp_session
-from aiohttp.web import Application, Request, middleware
+from aiohttp.web import Application, RouteDef
 
 import vocal.payments
 import vocal.util as util
-from vocal.config import AppConfig
-from vocal.api.security import AuthnSession, RedisStorage, SimpleCookieStorage
-from vocal.api.util import message_middleware
+from vocal.api.security import RedisStorage, SimpleCookieStorage
+from vocal.util.lru import LRUCache
 
+from . import catalog
 from . import routes
+from . import session_codec
 from . import storage
+from . import validation
+from .pipeline import error_middleware, pipeline
 
 
 async def configure(appctx):
     # e.g. configure storage, template renderer, etc
     await storage.configure(appctx)
+    await catalog.configure(appctx)
+    await validation.configure(appctx)
 
     config = appctx.config.get()
+
     sc = config.get('session')
 
+    appctx.declare('session_pool', None)
     if sc is not None:
         appctx.declare('session_store')
         if sc['storage'] == 'redis':
             pool = await aioredis.create_redis_pool(sc['pool'])
-            appctx.session_store.set(RedisStorage(pool, cookie_name=sc.get('cookie_name'),
-                                                  encoder=util.json.encode))
+            appctx.session_pool.set(pool)
+
+            cc = sc.get('cache')
+            cache = LRUCache(int(cc['max_size']), float(cc['ttl'])) if cc else None
+            store = RedisStorage(pool, cookie_name=sc.get('cookie_name'),
+                                 codec=session_codec.codec(sc.get('encoding', 'json')),
+                                 cache=cache)
+            if cache is not None:
+                await store.subscribe(lambda: aioredis.create_redis(sc['pool']))
+            appctx.session_store.set(store)
         elif sc['storage'] == 'simple':
             appctx.session_store.set(SimpleCookieStorage(cookie_name=sc.get('cookie_name'),
                                                          encoder=util.json.encode))
@@ -37,35 +52,40 @@ async def configure(appctx):
 
 
 async def initialize(appctx):
-    @middleware
-    async def context_injection_middleware(request, handler):
-        if not handler.__annotations__:
-            return await handler(request)
-        params = {}
-
-        new_session = handler.__annotations__.pop('__new_session', False)
-        for name, t in handler.__annotations__.items():
-            if t is AppConfig:
-                params[name] = appctx
-            elif t is AuthnSession:
-                if new_session:
-                    params[name] = await aiohttp_session.new_session(request)
-                else:
-                    params[name] = await aiohttp_session.get_session(request)
-            elif t is Request:
-                continue
-            elif name == 'return':
-                continue
-            else:
-                raise RuntimeError(f"don't know how to inject {name}")
-
-        return await handler(request, **params)
-
-    app = Application(middlewares=[aiohttp_session.session_middleware(appctx.session_store.get()),
-                                   util.web.json_response_middleware,
-                                   message_middleware,
-                                   context_injection_middleware])
-    app.add_routes(appctx.routes.get())
+    cache_control = appctx.config.get().get('cache', {}).get('cache_control', {})
+
+    app = Application(middlewares=[error_middleware,
+                                   aiohttp_session.session_middleware(appctx.session_store.get())])
+    app.add_routes([RouteDef(r.method, r.path,
+                             pipeline(appctx, r.handler,
+                                      cache_control=cache_control.get(f'{r.method} {r.path}')),
+                             r.kwargs)
+                    for r in appctx.routes.get()])
     app['appctx'] = appctx
+    app.on_startup.append(startup)
+    app.on_cleanup.append(cleanup)
 
     return app
+
+
+async def startup(app):
+    appctx = app['appctx']
+    poolconf = appctx.config.get()['storage'].get('pool', {})
+
+    await storage.prewarm(appctx.storage.get(), int(poolconf.get('prewarm', 0)))
+    await appctx.storage_replicas.get().check()
+
+
+async def cleanup(app):
+    # by now the server has stopped accepting connections, and in-flight requests have finished
+    # or been cancelled at the shutdown timeout
+    appctx = app['appctx']
+
+    pool = appctx.session_pool.get()
+    if pool is not None:
+        await appctx.session_store.get().close()
+        pool.close()
+        await pool.wait_closed()
+
+    await appctx.storage_replicas.get().dispose()
+    await appctx.storage.get().dispose()
@@ -0,0 +1,51 @@
+import hashlib
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+
+# returns the version of the data a request would be answered from, or raises ValueError if the
+# request is invalid
+VersionFunction = Callable[..., Awaitable[str]]
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    cache_control: Optional[str] = None
+    version: Optional[VersionFunction] = None
+
+
+def conditional(cache_control: Optional[str]=None, version: Optional[VersionFunction]=None):
+    """
+    Makes a GET route answer `If-None-Match` with `304 Not Modified` when the client's copy of
+    the response is current, and sends `cache_control`, if given, as `Cache-Control`.
+
+    Without `version` the ETag of a response is a digest of its body, which saves the transfer
+    but not the work of producing it. `version(request, appctx)` instead derives the ETag from
+    the version of the data the response depends on, and is checked before the handler is
+    called. It must change whenever the response would, and so cannot be used on a route whose
+    response depends on its session.
+    """
+    def f(handler):
+        handler.__annotations__['__cache'] = CachePolicy(cache_control=cache_control,
+                                                        version=version)
+        return handler
+    return f
+
+
+def etag(*parts) -> str:
+    "Returns a strong ETag which is a digest of `parts`."
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else str(part).encode('utf-8'))
+        h.update(b'\0')
+    return f'"{h.hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], tag: str) -> bool:
+    "Compares an `If-None-Match` header with `tag` by the weak comparison RFC 7232 requires."
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    tag = tag.removeprefix('W/')
+    return any(t.strip().removeprefix('W/') == tag for t in if_none_match.split(','))
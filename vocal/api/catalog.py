@@ -0,0 +1,135 @@
+import asyncio
+import hashlib
+import time
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import Optional
+from uuid import UUID
+
+import vocal.api.operations as op
+from vocal.api.message import PaginationStatus
+from vocal.api.models.base import model_collection
+from vocal.api.models.membership import SubscriptionPlan
+from vocal.api.storage.page import PageRequest, decode_token, encode_token
+from vocal.util import json
+
+
+@dataclass(frozen=True)
+class _snapshot:
+    plans: model_collection
+    plan_ids: list[UUID]
+    by_payment_demand: dict[UUID, SubscriptionPlan]
+    digest: str
+    loaded_at: float
+
+
+class PlanCatalog(object):
+    """
+    Every `SubscriptionPlan`, unmarshalled and held in memory so that plan reads do not touch
+    storage.
+
+    Operations declared with `invalidates='plan_catalog'` drop the catalog when their session
+    commits; it is reloaded on the next read. As a safety net for writes made elsewhere, e.g. by
+    another process, the catalog is also reloaded once it is `ttl` seconds old. Concurrent
+    reads of a dropped or expired catalog wait on a single reload.
+    """
+
+    def __init__(self, ttl: float=60.0):
+        self._ttl = ttl
+        self._snapshot = None
+        self._generation = 0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        self._generation += 1
+        self._snapshot = None
+
+    async def version(self, appctx) -> str:
+        """
+        Returns a digest of the plans' `default` view, which changes whenever any plan does and
+        is the same in every process which has loaded the same plans.
+        """
+        return (await self._get(appctx)).digest
+
+    async def plans(self, appctx) -> model_collection:
+        return (await self._get(appctx)).plans
+
+    async def plan(self, appctx, subscription_plan_id: UUID=None, payment_demand_id: UUID=None
+                   ) -> Optional[SubscriptionPlan]:
+        if not any([subscription_plan_id, payment_demand_id]):
+            raise ValueError("one of subscription_plan_id, payment_demand_id are required")
+
+        snapshot = await self._get(appctx)
+        if subscription_plan_id is not None:
+            plan = snapshot.plans.find(subscription_plan_id=subscription_plan_id)
+            if plan is None or payment_demand_id is None:
+                return plan
+            if snapshot.by_payment_demand.get(payment_demand_id) is not plan:
+                return None
+            return plan
+        return snapshot.by_payment_demand.get(payment_demand_id)
+
+    async def page(self, appctx, page: PageRequest) -> model_collection:
+        "Returns a page of plans, as `op.membership.get_subscription_plans(page=page)` would."
+        snapshot = await self._get(appctx)
+
+        start = 0
+        if page.token is not None:
+            key = decode_token(page.token)
+            try:
+                after, = key
+                after = UUID(after)
+            except ValueError:
+                raise ValueError(f"invalid page token: {page.token}")
+            start = bisect_right(snapshot.plan_ids, after)
+
+        end = start + page.size
+        plans = snapshot.plans[start:end]
+        next_page = None
+        if end < len(snapshot.plans):
+            next_page = encode_token((plans[-1].subscription_plan_id,))
+        return model_collection(plans, page=PaginationStatus(size=page.size, page=page.token,
+                                                             next_page=next_page))
+
+    async def _get(self, appctx) -> _snapshot:
+        snapshot = self._snapshot
+        if self._fresh(snapshot):
+            return snapshot
+
+        async with self._lock:
+            snapshot = self._snapshot
+            if self._fresh(snapshot):
+                return snapshot
+            return await self._load(appctx)
+
+    def _fresh(self, snapshot: Optional[_snapshot]) -> bool:
+        return snapshot is not None and time.monotonic() - snapshot.loaded_at < self._ttl
+
+    async def _load(self, appctx) -> _snapshot:
+        generation = self._generation
+        loaded_at = time.monotonic()
+        async with op.session(appctx) as ss:
+            plans = await op.membership.\
+                get_subscription_plans().\
+                unmarshal_with(SubscriptionPlan).\
+                execute(ss)
+
+        snapshot = _snapshot(plans=plans,
+                             plan_ids=[p.subscription_plan_id for p in plans],
+                             by_payment_demand={pd.payment_demand_id: p
+                                                for p in plans for pd in p.payment_demands},
+                             digest=hashlib.blake2b(json.encode_bytes(plans.get_view('default')),
+                                                    digest_size=16).hexdigest(),
+                             loaded_at=loaded_at)
+        # a write which committed while loading may not be reflected in what was loaded
+        if generation == self._generation:
+            self._snapshot = snapshot
+        return snapshot
+
+
+async def configure(appctx):
+    config = appctx.config.get()
+    catconf = config.get('catalog', {})
+
+    appctx.declare('plan_catalog')
+    appctx.plan_catalog.set(PlanCatalog(ttl=float(catconf.get('ttl', 60))))
@@ -1,5 +1,6 @@
 import dataclasses
 from dataclasses import dataclass, field
+from collections.abc import AsyncIterator
 from typing import Generic, Optional, TypeVar
 
 
@@ -22,9 +23,17 @@ class MessageStatus:
 
 @dataclass(frozen=True)
 class PaginationStatus:
-    page: int
-    total: int
     size: int
+    page: Optional[str]
+    next_page: Optional[str]
+
+
+class Page(list):
+    "A list of view data which `message()` sends as a `PagedResultMessage`."
+
+    def __init__(self, data=(), pagination: Optional[PaginationStatus]=None):
+        super().__init__(data)
+        self.pagination = pagination
 
 
 @dataclass(frozen=True)
@@ -45,6 +54,12 @@ class VectorResultMessage(ResultMessage):
     data: list[T]
 
 
+@dataclass(frozen=True)
+class StreamedResultMessage(ResultMessage):
+    "A `VectorResultMessage` whose data is sent element by element as the iterator yields it."
+    data: AsyncIterator[T]
+
+
 @dataclass(frozen=True)
 class PagedResultMessage(VectorResultMessage):
     page: PaginationStatus
@@ -1,23 +1,44 @@
 import dataclasses
-from collections.abc import Sequence
+from datetime import date, timedelta
+from decimal import Decimal
 from enum import Enum
-from typing import Callable, Generic, TypeVar
+from typing import Callable, Generic, Optional, TypeVar
 from uuid import UUID, uuid4
 
+from vocal.api.message import Page, PaginationStatus
 from vocal.api.storage import BaseRecord
+from vocal.util.indexed import IndexedSequence
 
 
 class ViewModel(object):
+    """
+    Base class of the dataclasses served as responses. `get_view()` returns the fields named by
+    a view declared with `define_view()`, or every field for the `default` view.
+
+    The view of a frozen model whose fields hold only scalar values is computed once per
+    instance, and each call returns a copy of it. Views of other models are computed on every
+    call, as a model_collection they hold may be appended to.
+    """
+
     def marshal_dict(self):
         return dataclasses.asdict(self)
 
     def get_view(self, view_name: str):
-        if view_name == 'default':
-            viewdef = [f.name for f in dataclasses.fields(self)]
-        else:
-            viewdef = self.__views__[view_name]
-        return {k: v.get_view(view_name) if isinstance(v, (ViewModel, model_collection)) else v
-                for k, v in self.marshal_dict().items() if k in viewdef}
+        serialize = view_serializer(self.__class__, view_name)
+        if not self.__dataclass_params__.frozen:
+            return serialize(self)
+
+        views = self.__dict__.setdefault('_ViewModel__views', {})
+        try:
+            return dict(views[view_name])
+        except KeyError:
+            pass
+
+        view = serialize(self)
+        if all(isinstance(v, _scalar_types) for v in view.values()):
+            views[view_name] = view
+            return dict(view)
+        return view
 
     @classmethod
     def unmarshal_recordset(cls, recs: list[BaseRecord]) -> 'model_collection[ViewModel]':
@@ -28,60 +49,67 @@ class ViewModel(object):
         raise NotImplementedError()
 
 
-class model_collection(Sequence):
-    def __init__(self, objs: list[ViewModel]=None):
-        self._objs = objs or []
+# values which cannot change, whose views may so be memoized
+_scalar_types = (str, int, float, type(None), UUID, Decimal, date, timedelta, Enum)
 
-    def __len__(self):
-        return self._objs.__len__()
 
-    def __getitem__(self, index):
-        return self._objs.__getitem__(index)
+class model_collection(IndexedSequence):
+    def __init__(self, objs: list[ViewModel]=None, page: Optional[PaginationStatus]=None):
+        super().__init__(objs)
+        self.page = page
 
     def get_view(self, view_name):
-        return [o.get_view(view_name) for o in self._objs]
-
-    def append(self, obj: ViewModel):
-        self._objs.append(obj)
-
-    def find(self, keyf: Callable[[ViewModel], bool]=None, **kwargs):
-        if keyf is not None:
-            for obj in self._objs:
-                if keyf(obj):
-                    return obj
-            return None
-
-        elif kwargs:
-            for obj in self._objs:
-                match = False
-                for key, val in kwargs.items():
-                    match = (getattr(obj, key) == val)
-                if match:
-                    return obj
-
-        raise RuntimeError("find() must be called with key function or kwargs")
-
-    def find_all(self, keyf: Callable[[ViewModel], bool]=None, **kwargs):
-        results = []
-        if keyf is not None:
-            for obj in self._objs:
-                if keyf(obj):
-                    results.append(obj)
-            return results
-
-        elif kwargs:
-            for obj in self._objs:
-                match = False
-                for key, val in kwargs.items():
-                    match = (getattr(obj, key) == val)
-                if match:
-                    results.append(obj)
-            return results
-
-        raise RuntimeError("find() must be called with key function or kwargs")
-
-    def __repr__(self):
-        return f"<{self.__class__.__name__} {self._objs}>"
+        view = [o.get_view(view_name) for o in self._items]
+        if self.page is not None:
+            return Page(view, self.page)
+        return view
+
+
+_serializers = {}
+
+
+def view_serializer(cls: type, view_name: str) -> Callable[[ViewModel], dict]:
+    """
+    Returns the function which serializes instances of `cls` as view `view_name`. It is built
+    once per class and view, from the view definition and the dataclass fields.
+
+    Fields which hold a model_collection are serialized as the same view; other nested
+    dataclasses as all of their fields, with the `default` view of any model_collection among
+    them; records as their dicts.
+    """
+    try:
+        return _serializers[cls, view_name]
+    except KeyError:
+        pass
+
+    if view_name == 'default':
+        names = tuple(f.name for f in dataclasses.fields(cls))
+    else:
+        viewdef = cls.__views__[view_name]
+        names = tuple(f.name for f in dataclasses.fields(cls) if f.name in viewdef)
+
+    def serialize(obj: ViewModel) -> dict:
+        return {name: _view_value(getattr(obj, name), view_name) for name in names}
+
+    _serializers[cls, view_name] = serialize
+    return serialize
+
+
+def _view_value(value, view_name: str):
+    if isinstance(value, BaseRecord):
+        return value.marshal_dict()
+    if isinstance(value, model_collection):
+        return value.get_view(view_name)
+    if isinstance(value, ViewModel):
+        return value.get_view('default')
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return {f.name: _view_value(getattr(value, f.name), 'default')
+                for f in dataclasses.fields(value)}
+    if type(value) in (list, tuple):
+        return type(value)(_view_value(v, view_name) for v in value)
+    if isinstance(value, dict):
+        return {k: _view_value(v, view_name) for k, v in value.items()}
+    return value
 
 
 def define_view(*fields: str, name: str):
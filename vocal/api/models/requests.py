@@ -26,7 +26,7 @@ class AuthnChallengeResponseRequest:
 
     @classmethod
     def unmarshal_request(cls, body: dict) -> 'AuthnChallengeResponseRequest':
-        return cls(challenge_id=UUID(body['challenge_id']),
+        return cls(challenge_id=body['challenge_id'],
                    passcode=str(body['passcode']))
 
 
@@ -50,9 +50,9 @@ class CreateSubscriptionRequest:
 
     @classmethod
     def unmarshal_request(cls, body: dict) -> 'CreateSubscriptionRequest':
-        return CreateSubscriptionRequest(payment_method_id=UUID(body['paymentMethodId']),
-                                         subscription_plan_id=UUID(body['subscriptionPlanId']),
-                                         payment_demand_id=UUID(body['paymentDemandId']))
+        return CreateSubscriptionRequest(payment_method_id=body['paymentMethodId'],
+                                         subscription_plan_id=body['subscriptionPlanId'],
+                                         payment_demand_id=body['paymentDemandId'])
 
 
 @dataclass(frozen=True)
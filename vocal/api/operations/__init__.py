@@ -1,13 +1,27 @@
+import asyncio
 from contextlib import asynccontextmanager
 from functools import partial, wraps
 
 import sqlalchemy.ext.asyncio
 
-from vocal.api.util import operation
+from vocal.api.storage import replica
+from vocal.api.util import InvalidatesKey, operation
 from . import user_profile, membership, authn
 
 
-async def execute(appctx, operations):
+async def execute(appctx, operations, batch=False):
+    """
+    Executes `operations` in order within a single session and returns their results.
+
+    With `batch=True` each operation instead runs in its own session and on its own pooled
+    connection, concurrently with the others. The operations still cost a round trip apiece,
+    but they overlap, so the batch takes about as long as its slowest operation rather than the
+    sum of them all; results are still returned in the order given. Every operation commits
+    independently, so only batch operations which do not depend on one another.
+    """
+    if batch:
+        return await _execute_batch(appctx, operations)
+
     results = []
     engine = appctx.storage.get()
     async with session(appctx) as s:
@@ -16,9 +30,36 @@ async def execute(appctx, operations):
     return results
 
 
+async def _execute_batch(appctx, operations):
+    async def execute_one(op):
+        async with session(appctx) as s:
+            return await op.execute(s)
+
+    tasks = [asyncio.ensure_future(execute_one(op)) for op in operations]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        raise
+
+
 @asynccontextmanager
 async def session(appctx):
+    """
+    Opens a transaction on the primary. Read-only operations executed in it are routed to a
+    replica, if any are configured, until the first write pins the session to the primary.
+
+    Once the transaction commits, the caches named by the `invalidates` of the operations
+    executed in it are invalidated.
+    """
     engine = appctx.storage.get()
+    replicas = appctx.storage_replicas.get() if 'storage_replicas' in appctx else None
     async with sqlalchemy.ext.asyncio.AsyncSession(engine) as s:
         async with s.begin():
-            yield s
+            async with replica.routing(replicas, s):
+                yield s
+
+        for name in s.sync_session.info.pop(InvalidatesKey, ()):
+            if name in appctx:
+                getattr(appctx, name).get().invalidate()
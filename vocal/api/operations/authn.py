@@ -8,7 +8,7 @@ from vocal.api.util import operation
 from vocal.api.storage.sql import user_auth
 
 
-@operation
+@operation(readonly=True)
 async def authenticate_user(session: AsyncSession, user_profile_id: UUID, password: str) -> bool:
     q = select(user_auth.c.password_crypt == f.crypt(password, user_auth.c.password_crypt)).\
         where(user_auth.c.user_profile_id == user_profile_id)
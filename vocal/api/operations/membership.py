@@ -8,7 +8,7 @@ import sqlalchemy.exc
 from sqlalchemy import func as f
 from sqlalchemy.engine.result import Result
 from sqlalchemy.ext.asyncio.session import AsyncSession
-from sqlalchemy.sql.expression import alias, exists, false, join, literal, select, true
+from sqlalchemy.sql.expression import alias, bindparam, exists, false, join, literal, select, true
 
 from vocal.constants import ISO4217Currency, SubscriptionPlanStatus, PaymentDemandType,\
         PaymentDemandPeriod, SubscriptionStatus
@@ -16,6 +16,8 @@ from vocal.util import dates
 from vocal.api.util import operation
 from vocal.api.storage.record import Recordset, SubscriptionPlanPaymentDemandRecord,\
         SubscriptionRecord
+from vocal.api.storage.page import KeysetPages, PageRequest
+from vocal.api.storage.statement import StatementVariants
 from vocal.api.storage.sql import subscription_plan, payment_demand, subscription
 
 
@@ -25,7 +27,7 @@ PaymentDemandDesc = Union[tuple[PaymentDemandType, PaymentDemandPeriod, Decimal,
                                 Optional[str]]]
 
 
-@operation
+@operation(invalidates='plan_catalog')
 async def create_subscription_plan(session: AsyncSession, description: str,
                                    payment_demands: tuple[PaymentDemandDesc],
                                    rank: Optional[int]=None, name: Optional[str]=None
@@ -50,7 +52,7 @@ async def create_subscription_plan(session: AsyncSession, description: str,
     return plan_id
 
 
-@operation
+@operation(invalidates='plan_catalog')
 async def add_periodic_payment_demand(session: AsyncSession, subscription_plan_id: UUID,
                                       period: PaymentDemandPeriod, amount: Decimal,
                                       iso_currency: Optional[ISO4217Currency]=None,
@@ -77,7 +79,7 @@ async def add_periodic_payment_demand(session: AsyncSession, subscription_plan_i
     return r.scalar()
 
 
-@operation
+@operation(invalidates='plan_catalog')
 async def add_immediate_payment_demand(session: AsyncSession, subscription_plan_id: UUID,
                                        amount: Decimal,
                                        iso_currency: Optional[ISO4217Currency]=None,
@@ -102,67 +104,61 @@ async def add_immediate_payment_demand(session: AsyncSession, subscription_plan_
     return r.scalar()
 
 
-@operation(record_cls=SubscriptionPlanPaymentDemandRecord)
-async def get_subscription_plans(session: AsyncSession) -> Recordset:
-    q = select(subscription_plan.c.subscription_plan_id,
-               subscription_plan.c.status,
-               subscription_plan.c.rank,
-               subscription_plan.c.name,
-               subscription_plan.c.description,
-               payment_demand.c.payment_demand_id,
-               payment_demand.c.demand_type,
-               payment_demand.c.period,
-               payment_demand.c.amount,
-               payment_demand.c.iso_currency,
-               payment_demand.c.non_iso_currency).\
-        select_from(subscription_plan).\
-        join(payment_demand).\
-        order_by(subscription_plan.c.subscription_plan_id,
-                 (subscription_plan.c.status == SubscriptionPlanStatus.Active).desc(),
-                 (payment_demand.c.demand_type == PaymentDemandType.Periodic).desc(),
-                 (payment_demand.c.period == PaymentDemandPeriod.Daily).desc(),
-                 (payment_demand.c.period == PaymentDemandPeriod.Weekly).desc(),
-                 (payment_demand.c.period == PaymentDemandPeriod.Monthly).desc(),
-                 (payment_demand.c.period == PaymentDemandPeriod.Quarterly).desc(),
-                 (payment_demand.c.period == PaymentDemandPeriod.Annually).desc())
-    return await session.execute(q)
-
-
-@operation(SubscriptionPlanPaymentDemandRecord, single_result=True)
+_subscription_plans_q = \
+    select(subscription_plan.c.subscription_plan_id,
+           subscription_plan.c.status,
+           subscription_plan.c.rank,
+           subscription_plan.c.name,
+           subscription_plan.c.description,
+           payment_demand.c.payment_demand_id,
+           payment_demand.c.demand_type,
+           payment_demand.c.period,
+           payment_demand.c.amount,
+           payment_demand.c.iso_currency,
+           payment_demand.c.non_iso_currency).\
+    select_from(subscription_plan).\
+    join(payment_demand).\
+    order_by(subscription_plan.c.subscription_plan_id,
+             (subscription_plan.c.status == SubscriptionPlanStatus.Active).desc(),
+             (payment_demand.c.demand_type == PaymentDemandType.Periodic).desc(),
+             (payment_demand.c.period == PaymentDemandPeriod.Daily).desc(),
+             (payment_demand.c.period == PaymentDemandPeriod.Weekly).desc(),
+             (payment_demand.c.period == PaymentDemandPeriod.Monthly).desc(),
+             (payment_demand.c.period == PaymentDemandPeriod.Quarterly).desc(),
+             (payment_demand.c.period == PaymentDemandPeriod.Annually).desc())
+_subscription_plan_q = StatementVariants(
+    _subscription_plans_q,
+    subscription_plan_id=subscription_plan.c.subscription_plan_id ==
+                         bindparam('subscription_plan_id'),
+    payment_demand_id=payment_demand.c.payment_demand_id == bindparam('payment_demand_id'))
+
+
+_subscription_plans_page_q = KeysetPages(
+    _subscription_plans_q,
+    select(subscription_plan.c.subscription_plan_id))
+
+
+@operation(record_cls=SubscriptionPlanPaymentDemandRecord, readonly=True,
+           page_key=('subscription_plan_id',))
+async def get_subscription_plans(session: AsyncSession, page: Optional[PageRequest]=None
+                                 ) -> Recordset:
+    if page is None:
+        return await session.execute(_subscription_plans_q)
+
+    q, params = _subscription_plans_page_q(page)
+    return await session.execute(q, params)
+
+
+@operation(SubscriptionPlanPaymentDemandRecord, single_result=True, readonly=True)
 async def get_subscription_plan(session: AsyncSession, subscription_plan_id: UUID=None,
                                 payment_demand_id: UUID=None
                                 ) -> Result:
     if not any([subscription_plan_id , payment_demand_id]):
         raise ValueError("one of subscription_plan_id, payment_demand_id are required")
 
-    q = select(subscription_plan.c.subscription_plan_id,
-               subscription_plan.c.status,
-               subscription_plan.c.rank,
-               subscription_plan.c.name,
-               subscription_plan.c.description,
-               payment_demand.c.payment_demand_id,
-               payment_demand.c.demand_type,
-               payment_demand.c.period,
-               payment_demand.c.amount,
-               payment_demand.c.iso_currency,
-               payment_demand.c.non_iso_currency).\
-        select_from(subscription_plan).\
-        join(payment_demand).\
-        order_by(subscription_plan.c.subscription_plan_id,
-                 (subscription_plan.c.status == SubscriptionPlanStatus.Active).desc(),
-                 (payment_demand.c.demand_type == PaymentDemandType.Periodic).desc(),
-                 (payment_demand.c.period == PaymentDemandPeriod.Daily).desc(),
-                 (payment_demand.c.period == PaymentDemandPeriod.Weekly).desc(),
-                 (payment_demand.c.period == PaymentDemandPeriod.Monthly).desc(),
-                 (payment_demand.c.period == PaymentDemandPeriod.Quarterly).desc(),
-                 (payment_demand.c.period == PaymentDemandPeriod.Annually).desc())
-
-    if subscription_plan_id is not None:
-        q = q.where(subscription_plan.c.subscription_plan_id == subscription_plan_id)
-    if payment_demand_id is not None:
-        q = q.where(payment_demand.c.payment_demand_id == payment_demand_id)
-
-    return await session.execute(q)
+    q, params = _subscription_plan_q(subscription_plan_id=subscription_plan_id,
+                                     payment_demand_id=payment_demand_id)
+    return await session.execute(q, params)
 
 
 @operation(SubscriptionRecord, single_result=True)
@@ -211,25 +207,28 @@ async def create_subscription(session: AsyncSession, user_profile_id: UUID,
                   subscription.c.current_status_until))
 
 
-@operation(SubscriptionRecord)
+_subscriptions_q = StatementVariants(
+    select(subscription.c.user_profile_id,
+           subscription.c.subscription_plan_id,
+           subscription.c.payment_demand_id,
+           subscription.c.payment_profile_id,
+           subscription.c.payment_method_id,
+           subscription.c.processor_charge_id,
+           subscription.c.status,
+           subscription.c.started_at,
+           subscription.c.current_status_until).
+    select_from(subscription).
+    where(subscription.c.user_profile_id == bindparam('user_profile_id')),
+    subscription_plan_id=subscription.c.subscription_plan_id == bindparam('subscription_plan_id'),
+    payment_demand_id=subscription.c.payment_demand_id == bindparam('payment_demand_id'))
+
+
+@operation(SubscriptionRecord, readonly=True)
 async def get_subscriptions(session: AsyncSession, user_profile_id: UUID,
                            subscription_plan_id: Optional[UUID]=None,
                            payment_demand_id: Optional[UUID]=None,
                            ) -> Result:
-    q = select(subscription.c.user_profile_id,
-               subscription.c.subscription_plan_id,
-               subscription.c.payment_demand_id,
-               subscription.c.payment_profile_id,
-               subscription.c.payment_method_id,
-               subscription.c.processor_charge_id,
-               subscription.c.status,
-               subscription.c.started_at,
-               subscription.c.current_status_until).\
-        select_from(subscription).\
-        where(subscription.c.user_profile_id == user_profile_id)
-    if subscription_plan_id is not None:
-        q = q.where(subscription.c.subscription_plan_id == subscription_plan_id)
-    if payment_demand_id is not None:
-        q = q.where(subscription.c.payment_demand_id == payment_demand_id)
-
-    return await session.execute(q)
+    q, params = _subscriptions_q(user_profile_id=user_profile_id,
+                                 subscription_plan_id=subscription_plan_id,
+                                 payment_demand_id=payment_demand_id)
+    return await session.execute(q, params)
@@ -6,60 +6,63 @@ import sqlalchemy.exc
 from sqlalchemy import func as f
 from sqlalchemy.engine.result import Result
 from sqlalchemy.ext.asyncio.session import AsyncSession
-from sqlalchemy.sql.expression import alias, exists, false, join, literal, select, true
+from sqlalchemy.sql.expression import alias, bindparam, exists, false, join, literal, select, true
 
 from vocal.constants import ContactMethodType, PaymentMethodType, PaymentMethodStatus, UserRole,\
         SubscriptionStatus
 from vocal.api.storage.record import UserProfileRecord, ContactMethodRecord,\
         PaymentMethodRecord, PaymentProfileRecord, Recordset, SubscriberUserProfileRecord
+from vocal.api.storage.page import KeysetPages, PageRequest
+from vocal.api.storage.statement import StatementVariants
 from vocal.api.storage.sql import user_profile, user_auth, contact_method, email_contact_method,\
         phone_contact_method, payment_profile, payment_method, subscription, subscription_plan,\
         payment_demand
 from vocal.api.util import operation
 
 
-@operation(UserProfileRecord, single_result=True, default=None)
+_email = contact_method.alias()
+_phone = contact_method.alias()
+_user_profile_q = StatementVariants(
+    select(user_profile.c.user_profile_id,
+           user_profile.c.display_name,
+           user_profile.c.created_at,
+           user_profile.c.name,
+           user_profile.c.role,
+           _email.c.contact_method_id,
+           _email.c.verified,
+           email_contact_method.c.email_address,
+           _phone.c.contact_method_id,
+           _phone.c.verified,
+           phone_contact_method.c.phone_number).
+    select_from(user_profile).
+    outerjoin(_email,
+              (user_profile.c.user_profile_id == _email.c.user_profile_id) &
+              (_email.c.contact_method_type == ContactMethodType.Email)).
+    outerjoin(_phone,
+              (user_profile.c.user_profile_id == _phone.c.user_profile_id) &
+              (_phone.c.contact_method_type == ContactMethodType.Phone)).
+    outerjoin(email_contact_method,
+              (_email.c.user_profile_id == email_contact_method.c.user_profile_id) &
+              (_email.c.contact_method_id == email_contact_method.c.contact_method_id)).
+    outerjoin(phone_contact_method,
+              (_phone.c.user_profile_id == phone_contact_method.c.user_profile_id) &
+              (_phone.c.contact_method_id == phone_contact_method.c.contact_method_id)),
+    user_profile_id=user_profile.c.user_profile_id == bindparam('user_profile_id'),
+    email_address=email_contact_method.c.email_address == bindparam('email_address'),
+    phone_number=phone_contact_method.c.phone_number == bindparam('phone_number'))
+
+
+@operation(UserProfileRecord, single_result=True, default=None, readonly=True)
 async def get_user_profile(session: AsyncSession, user_profile_id: UUID=None,
                            email_address: str=None, phone_number: str=None
                            ) -> Result:
     if not any([user_profile_id, email_address, phone_number]):
         raise ValueError("one of user_profile_id, email_address, phone_number are required")
 
-    email = contact_method.alias()
-    phone = contact_method.alias()
-    q = select(user_profile.c.user_profile_id,
-               user_profile.c.display_name,
-               user_profile.c.created_at,
-               user_profile.c.name,
-               user_profile.c.role,
-               email.c.contact_method_id,
-               email.c.verified,
-               email_contact_method.c.email_address,
-               phone.c.contact_method_id,
-               phone.c.verified,
-               phone_contact_method.c.phone_number).\
-        select_from(user_profile).\
-        outerjoin(email,
-                  (user_profile.c.user_profile_id == email.c.user_profile_id) &
-                  (email.c.contact_method_type == ContactMethodType.Email)).\
-        outerjoin(phone,
-                  (user_profile.c.user_profile_id == phone.c.user_profile_id) &
-                  (phone.c.contact_method_type == ContactMethodType.Phone)).\
-        outerjoin(email_contact_method,
-                  (email.c.user_profile_id == email_contact_method.c.user_profile_id) &
-                  (email.c.contact_method_id == email_contact_method.c.contact_method_id)).\
-        outerjoin(phone_contact_method,
-                  (phone.c.user_profile_id == phone_contact_method.c.user_profile_id) &
-                  (phone.c.contact_method_id == phone_contact_method.c.contact_method_id))
-
-    if user_profile_id is not None:
-        q = q.where(user_profile.c.user_profile_id == user_profile_id)
-    if email_address is not None:
-        q = q.where(email_contact_method.c.email_address == email_address)
-    if phone_number is not None:
-        q = q.where(phone_contact_method.c.phone_number == phone_number)
-
-    return await session.execute(q)
+    q, params = _user_profile_q(user_profile_id=user_profile_id,
+                                email_address=email_address,
+                                phone_number=phone_number)
+    return await session.execute(q, params)
 
 
 @operation
@@ -151,7 +154,7 @@ async def add_contact_method(session: AsyncSession, user_profile_id: UUID,
     raise ValueError("one of email_address or phone_number is required")
 
 
-@operation(record_cls=ContactMethodRecord, single_result=True)
+@operation(record_cls=ContactMethodRecord, single_result=True, readonly=True)
 async def get_contact_method(session: AsyncSession, contact_method_id: UUID,
                              user_profile_id: UUID=None
                              ) -> Result:
@@ -237,7 +240,7 @@ async def add_payment_method(session: AsyncSession, user_profile_id: UUID,
     return rs.scalar()
 
 
-@operation(single_result=True, record_cls=PaymentProfileRecord, default=None)
+@operation(single_result=True, record_cls=PaymentProfileRecord, default=None, readonly=True)
 async def get_payment_profile(session: AsyncSession, user_profile_id: UUID,
                               processor_id: str
                               ) -> PaymentProfileRecord:
@@ -250,7 +253,29 @@ async def get_payment_profile(session: AsyncSession, user_profile_id: UUID,
     return await session.execute(q)
 
 
-@operation(record_cls=PaymentMethodRecord)
+_payment_methods_q = StatementVariants(
+    select(payment_profile.c.user_profile_id,
+           payment_profile.c.payment_profile_id,
+           payment_profile.c.processor_id,
+           payment_profile.c.processor_customer_profile_id,
+           payment_method.c.payment_method_id,
+           payment_method.c.processor_payment_method_id,
+           payment_method.c.payment_method_type,
+           payment_method.c.payment_method_family,
+           payment_method.c.display_name,
+           payment_method.c.safe_account_number_fragment,
+           payment_method.c.status,
+           payment_method.c.expires_after).
+    select_from(payment_profile).
+    join(payment_method).
+    where(payment_profile.c.user_profile_id == bindparam('user_profile_id')),
+    payment_method_id=payment_method.c.payment_method_id == bindparam('payment_method_id'),
+    payment_profile_id=payment_profile.c.payment_profile_id == bindparam('payment_profile_id'),
+    processor_id=payment_profile.c.processor_id == bindparam('processor_id'),
+    status=payment_method.c.status == bindparam('status'))
+
+
+@operation(record_cls=PaymentMethodRecord, readonly=True)
 async def get_payment_methods(session: AsyncSession, user_profile_id: UUID,
                               payment_profile_id: Optional[UUID]=None,
                               payment_method_id: Optional[UUID]=None,
@@ -261,95 +286,89 @@ async def get_payment_methods(session: AsyncSession, user_profile_id: UUID,
         raise ValueError("one of payment_profile_id, payment_method_id, processor_id "
                          "are required")
 
-    q = select(payment_profile.c.user_profile_id,
-               payment_profile.c.payment_profile_id,
-               payment_profile.c.processor_id,
-               payment_profile.c.processor_customer_profile_id,
-               payment_method.c.payment_method_id,
-               payment_method.c.processor_payment_method_id,
-               payment_method.c.payment_method_type,
-               payment_method.c.payment_method_family,
-               payment_method.c.display_name,
-               payment_method.c.safe_account_number_fragment,
-               payment_method.c.status,
-               payment_method.c.expires_after).\
-        select_from(payment_profile).\
-        join(payment_method).\
-        where(payment_profile.c.user_profile_id == user_profile_id)
-
-    if payment_method_id is not None:
-        q = q.where(payment_method.c.payment_method_id == payment_method_id)
-    if payment_profile_id is not None:
-        q = q.where(payment_profile.c.payment_profile_id == payment_profile_id)
-    if processor_id is not None:
-        q = q.where(payment_profile.c.processor_id == processor_id)
-    if status is not None:
-        q = q.where(payment_method.c.status == status)
-
-    return await session.execute(q)
-
-
-@operation(SubscriberUserProfileRecord)
+    q, params = _payment_methods_q(user_profile_id=user_profile_id,
+                                   payment_method_id=payment_method_id,
+                                   payment_profile_id=payment_profile_id,
+                                   processor_id=processor_id,
+                                   status=status)
+    return await session.execute(q, params)
+
+
+_subscriber_profiles = (
+    select(user_profile.c.user_profile_id,
+           user_profile.c.display_name,
+           user_profile.c.created_at,
+           user_profile.c.name,
+           user_profile.c.role,
+           _email.c.contact_method_id,
+           _email.c.verified,
+           email_contact_method.c.email_address,
+           _phone.c.contact_method_id,
+           _phone.c.verified,
+           phone_contact_method.c.phone_number,
+           subscription_plan.c.subscription_plan_id,
+           subscription_plan.c.rank,
+           subscription_plan.c.name,
+           subscription_plan.c.description,
+           payment_profile.c.processor_id,
+           payment_profile.c.processor_customer_profile_id,
+           payment_demand.c.payment_demand_id,
+           payment_demand.c.demand_type,
+           payment_demand.c.period,
+           payment_demand.c.iso_currency,
+           payment_demand.c.non_iso_currency,
+           payment_demand.c.amount,
+           subscription.c.status,
+           subscription.c.processor_charge_id,
+           subscription.c.started_at,
+           subscription.c.current_status_at,
+           subscription.c.current_status_until,
+           ).
+    select_from(user_profile).
+    outerjoin(_email,
+              (user_profile.c.user_profile_id == _email.c.user_profile_id) &
+              (_email.c.contact_method_type == ContactMethodType.Email)).
+    outerjoin(_phone,
+              (user_profile.c.user_profile_id == _phone.c.user_profile_id) &
+              (_phone.c.contact_method_type == ContactMethodType.Phone)).
+    outerjoin(email_contact_method,
+              (_email.c.user_profile_id == email_contact_method.c.user_profile_id) &
+              (_email.c.contact_method_id == email_contact_method.c.contact_method_id)).
+    outerjoin(phone_contact_method,
+              (_phone.c.user_profile_id == phone_contact_method.c.user_profile_id) &
+              (_phone.c.contact_method_id == phone_contact_method.c.contact_method_id)).
+    join(subscription,
+         (subscription.c.user_profile_id == user_profile.c.user_profile_id)).
+    join(subscription_plan,
+         (subscription.c.subscription_plan_id == subscription_plan.c.subscription_plan_id)).
+    join(payment_demand,
+         (subscription.c.subscription_plan_id == payment_demand.c.subscription_plan_id) &
+         (subscription.c.payment_demand_id == payment_demand.c.payment_demand_id)).
+    join(payment_profile,
+         (subscription.c.user_profile_id == payment_profile.c.user_profile_id) &
+         (subscription.c.payment_profile_id == payment_profile.c.payment_profile_id)).
+    where(subscription.c.subscription_plan_id == bindparam('subscription_plan_id')))
+_subscriber_profiles_q = StatementVariants(
+    _subscriber_profiles,
+    status=subscription.c.status == bindparam('status'))
+_subscriber_profiles_page_q = KeysetPages(
+    _subscriber_profiles.order_by(subscription.c.user_profile_id,
+                                  subscription.c.payment_demand_id),
+    select(subscription.c.user_profile_id, subscription.c.payment_demand_id).
+    where(subscription.c.subscription_plan_id == bindparam('subscription_plan_id')),
+    status=subscription.c.status == bindparam('status'))
+
+
+@operation(SubscriberUserProfileRecord, readonly=True,
+           page_key=('user_profile_id', 'payment_demand_id'))
 async def get_subscriber_profiles(session: AsyncSession, subscription_plan_id: UUID,
-                                  status: Optional[SubscriptionStatus]=SubscriptionStatus.Current
+                                  status: Optional[SubscriptionStatus]=SubscriptionStatus.Current,
+                                  page: Optional[PageRequest]=None
                                   ) -> Result:
-    email = contact_method.alias()
-    phone = contact_method.alias()
-    q = select(user_profile.c.user_profile_id,
-               user_profile.c.display_name,
-               user_profile.c.created_at,
-               user_profile.c.name,
-               user_profile.c.role,
-               email.c.contact_method_id,
-               email.c.verified,
-               email_contact_method.c.email_address,
-               phone.c.contact_method_id,
-               phone.c.verified,
-               phone_contact_method.c.phone_number,
-               subscription_plan.c.subscription_plan_id,
-               subscription_plan.c.rank,
-               subscription_plan.c.name,
-               subscription_plan.c.description,
-               payment_profile.c.processor_id,
-               payment_profile.c.processor_customer_profile_id,
-               payment_demand.c.payment_demand_id,
-               payment_demand.c.demand_type,
-               payment_demand.c.period,
-               payment_demand.c.iso_currency,
-               payment_demand.c.non_iso_currency,
-               payment_demand.c.amount,
-               subscription.c.status,
-               subscription.c.processor_charge_id,
-               subscription.c.started_at,
-               subscription.c.current_status_at,
-               subscription.c.current_status_until,
-               ).\
-        select_from(user_profile).\
-        outerjoin(email,
-                  (user_profile.c.user_profile_id == email.c.user_profile_id) &
-                  (email.c.contact_method_type == ContactMethodType.Email)).\
-        outerjoin(phone,
-                  (user_profile.c.user_profile_id == phone.c.user_profile_id) &
-                  (phone.c.contact_method_type == ContactMethodType.Phone)).\
-        outerjoin(email_contact_method,
-                  (email.c.user_profile_id == email_contact_method.c.user_profile_id) &
-                  (email.c.contact_method_id == email_contact_method.c.contact_method_id)).\
-        outerjoin(phone_contact_method,
-                  (phone.c.user_profile_id == phone_contact_method.c.user_profile_id) &
-                  (phone.c.contact_method_id == phone_contact_method.c.contact_method_id)).\
-        join(subscription,
-             (subscription.c.user_profile_id == user_profile.c.user_profile_id)).\
-        join(subscription_plan,
-             (subscription.c.subscription_plan_id == subscription_plan.c.subscription_plan_id)).\
-        join(payment_demand,
-             (subscription.c.subscription_plan_id == payment_demand.c.subscription_plan_id) &
-             (subscription.c.payment_demand_id == payment_demand.c.payment_demand_id)).\
-        join(payment_profile,
-             (subscription.c.user_profile_id == payment_profile.c.user_profile_id) &
-             (subscription.c.payment_profile_id == payment_profile.c.payment_profile_id)).\
-        where(subscription.c.subscription_plan_id == subscription_plan_id)
-
-    if status is not None:
-        q = q.where(subscription.c.status == status)
-
-    return await session.execute(q)
+    if page is None:
+        q, params = _subscriber_profiles_q(subscription_plan_id=subscription_plan_id,
+                                           status=status)
+    else:
+        q, params = _subscriber_profiles_page_q(page, subscription_plan_id=subscription_plan_id,
+                                                status=status)
+    return await session.execute(q, params)
@@ -0,0 +1,184 @@
+from functools import wraps
+
+import aiohttp_session
+from aiohttp import hdrs
+from aiohttp.web import Request, Response, StreamResponse, middleware
+from aiohttp.web_exceptions import HTTPException
+
+from vocal.config import AppConfig
+from vocal.api.cache import etag, etag_matches
+from vocal.api.message import ResultMessage, StreamedResultMessage
+from vocal.api.security import AuthnSession, LazySession
+from vocal.api.util import envelope, message
+from vocal.util import json
+
+
+def inject(appctx, handler):
+    """
+    Wraps `handler` to be called with the arguments its annotations ask for. How to resolve each
+    argument is worked out here, once per route, rather than on every request.
+    """
+    annotations = handler.__annotations__
+    new_session = annotations.get('__new_session', False)
+
+    constants = {}
+    resolvers = []
+    for name, t in annotations.items():
+        if name in ('__new_session', '__cache', 'return') or t is Request:
+            continue
+        elif t is AppConfig:
+            constants[name] = appctx
+        elif t is AuthnSession:
+            if new_session:
+                # creating a session does not touch its store
+                resolvers.append((name, aiohttp_session.new_session))
+            else:
+                resolvers.append((name, aiohttp_session.get_session))
+        elif t is LazySession:
+            # the handler loads the session itself, if it needs it
+            resolvers.append((name, _lazy_session))
+        else:
+            raise RuntimeError(f"don't know how to inject {name}")
+
+    if not (constants or resolvers):
+        return handler
+
+    @wraps(handler)
+    async def f(request):
+        params = constants.copy()
+        resolved = {}
+        for name, resolve in resolvers:
+            # every argument which asks for the session is given the same one
+            if resolve not in resolved:
+                resolved[resolve] = await resolve(request)
+            params[name] = resolved[resolve]
+        return await handler(request, **params)
+    return f
+
+
+async def _lazy_session(request) -> LazySession:
+    return LazySession(request)
+
+
+def pipeline(appctx, handler, encode=json.encode_bytes, cache_control: str=None):
+    """
+    Compiles a route handler into the one coroutine that serves its route: it injects the
+    handler's arguments, calls it, wraps the result in a message and serializes the message.
+    Everything that depends only on the handler is done here, at startup.
+
+    `cache_control` overrides the `Cache-Control` of the handler's `CachePolicy`, if any.
+    """
+    annotations = handler.__annotations__
+    policy = annotations.get('__cache')
+    if policy is not None and policy.version is not None and '__requires_session' in annotations:
+        raise RuntimeError(f"{handler.__name__} is versioned and cannot require a session")
+
+    conditional = policy is not None
+    version = policy.version if conditional else None
+    cache_control = cache_control or (policy.cache_control if conditional else None)
+    headers = {hdrs.CACHE_CONTROL: cache_control} if cache_control else {}
+    call = message(inject(appctx, handler))
+
+    @wraps(handler)
+    async def f(request):
+        tag = None
+        conditional_request = conditional and request.method in (hdrs.METH_GET, hdrs.METH_HEAD)
+        if conditional_request and version is not None:
+            try:
+                tag = etag(await version(request, appctx))
+            except ValueError:
+                # invalid requests are left to the handler to reject
+                pass
+            else:
+                if etag_matches(request.headers.get(hdrs.IF_NONE_MATCH), tag):
+                    return Response(status=304, headers={**headers, hdrs.ETAG: tag})
+
+        msg = await call(request)
+        if isinstance(msg, StreamResponse):
+            return msg
+        if isinstance(msg, StreamedResultMessage):
+            return await stream(request, msg, encode,
+                                headers={**headers, hdrs.ETAG: tag} if tag else headers)
+
+        body = encode(msg)
+        if not conditional_request:
+            return Response(body=body, headers=headers, content_type='application/json',
+                            charset='utf-8')
+
+        tag = tag or etag(body)
+        if etag_matches(request.headers.get(hdrs.IF_NONE_MATCH), tag):
+            return Response(status=304, headers={**headers, hdrs.ETAG: tag})
+        return Response(body=body, headers={**headers, hdrs.ETAG: tag},
+                        content_type='application/json', charset='utf-8')
+    return f
+
+
+@middleware
+async def error_middleware(request, handler):
+    """
+    Sends an `HTTPException` raised outside of a route's pipeline as an error message, as the
+    pipeline does for those raised by its handler: the router raises them when no route matches
+    a request's path or method.
+    """
+    try:
+        return await handler(request)
+    except HTTPException as e:
+        if e.empty_body:
+            raise
+        return envelope(e)
+
+
+StreamChunkSize = 64 * 1024
+
+_end = object()
+
+
+async def stream(request, msg: StreamedResultMessage, encode=json.encode_bytes,
+                 headers: dict=None) -> StreamResponse:
+    """
+    Sends `msg` with chunked transfer encoding, encoding its data elements as the iterator
+    yields them and writing them out about `StreamChunkSize` bytes at a time. The body is the
+    same as that of the `VectorResultMessage` of the elements. `headers` are sent with it; an
+    `ETag` only if the handler's version gives one, as the body is not known in advance.
+
+    An `HTTPException` or `ValueError` raised before the first element is sent as an error
+    message. Once the response has started an error aborts it, leaving the body incomplete.
+    """
+    items = msg.data.__aiter__()
+    try:
+        try:
+            first = await items.__anext__()
+        except StopAsyncIteration:
+            first = _end
+        except HTTPException as e:
+            if e.empty_body:
+                raise
+            return envelope(e)
+        except ValueError as e:
+            return envelope(e)
+
+        resp = StreamResponse(headers=headers)
+        resp.content_type = 'application/json'
+        resp.charset = 'utf-8'
+        resp.enable_chunked_encoding()
+        await resp.prepare(request)
+
+        # the encoded `{"status": ...}` of the message, opened up to take the data
+        chunk = bytearray(encode(ResultMessage(status=msg.status))[:-1])
+        chunk += b', "data": ['
+        if first is not _end:
+            chunk += encode(first)
+            async for item in items:
+                if len(chunk) >= StreamChunkSize:
+                    await resp.write(bytes(chunk))
+                    chunk.clear()
+                chunk += b', '
+                chunk += encode(item)
+        chunk += b']}'
+        await resp.write(bytes(chunk))
+        await resp.write_eof()
+        return resp
+    finally:
+        if hasattr(items, 'aclose'):
+            await items.aclose()
+
@@ -1,3 +1,8 @@
+import asyncio
+import copy
+import logging
+import time
+import uuid
 from dataclasses import dataclass
 from enum import Enum
 from functools import wraps
@@ -5,6 +10,7 @@ from typing import Optional
 from uuid import UUID
 
 import aiohttp_session
+import aioredis
 from aiohttp_session import SimpleCookieStorage, Session as BaseSession
 from aiohttp_session.redis_storage import RedisStorage
 from aiohttp.web_exceptions import HTTPForbidden
@@ -12,6 +18,10 @@ from aiohttp.web_exceptions import HTTPForbidden
 from vocal.api.models.user_profile import UserProfile, ContactMethod
 from vocal.api.models.authn import AuthnChallenge, AuthnChallengeType
 from vocal.constants import UserRole
+from vocal.util.lru import LRUCache
+
+
+logger = logging.getLogger(__name__)
 
 
 MaxVerificationChallengeAttempts = 3
@@ -26,6 +36,65 @@ class Capability(Enum):
     SubscriptionCreate = 'subscription.create'
 
 
+# the position of a capability is its flag, which the binary session encoding stores, so
+# capabilities may only be appended
+CapabilityFlag = {cap: 1 << i for i, cap in enumerate(Capability)}
+
+
+def capability_flags(caps) -> int:
+    flags = 0
+    for cap in caps:
+        flags |= CapabilityFlag[cap]
+    return flags
+
+
+class CapabilitySet(object):
+    """
+    An immutable set of capabilities, held as the bitwise OR of their flags so that checking
+    for several capabilities is a single AND. It is serialized as a list of capability values.
+    """
+
+    __slots__ = ('flags',)
+
+    def __init__(self, flags: int=0):
+        self.flags = flags
+
+    @classmethod
+    def of(cls, caps) -> 'CapabilitySet':
+        return cls(capability_flags(caps))
+
+    @classmethod
+    def unmarshal(cls, values: list[str]) -> 'CapabilitySet':
+        return cls.of(Capability(v) for v in values)
+
+    def includes(self, flags: int) -> bool:
+        return self.flags & flags == flags
+
+    def __contains__(self, cap):
+        return self.includes(CapabilityFlag[cap])
+
+    def __iter__(self):
+        return (cap for cap, flag in CapabilityFlag.items() if self.flags & flag)
+
+    def __len__(self):
+        return bin(self.flags).count('1')
+
+    def __eq__(self, other):
+        return isinstance(other, CapabilitySet) and self.flags == other.flags
+
+    def __hash__(self):
+        return hash(self.flags)
+
+    def __copy__(self):
+        return self
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({{{", ".join(cap.value for cap in self)}}})'
+
+    def marshal_dict(self) -> list[str]:
+        return [cap.value for cap in self]
+
+
 RoleCapability = {
     UserRole.Superuser: {Capability.Authenticate, Capability.ProfileList,
                          Capability.PlanCreate, Capability.PaymentMethodCreate,
@@ -36,6 +105,8 @@ RoleCapability = {
     UserRole.Member: {Capability.ProfileList, Capability.PaymentMethodCreate},
 }
 
+RoleCapabilityFlags = {role: capability_flags(caps) for role, caps in RoleCapability.items()}
+
 
 class AuthnSession(BaseSession):
     def __init__(self, identity, *, data, new, max_age=None):
@@ -44,7 +115,7 @@ class AuthnSession(BaseSession):
             data.update({
                 'session': {
                     'authenticated': False,
-                    'capabilities': [],
+                    'capabilities': CapabilitySet(),
                     'pending_challenge': None,
                     'required_challenges': [],
                     'user_profile_id': None,
@@ -53,19 +124,42 @@ class AuthnSession(BaseSession):
         else:
             session_data = data.get('session', None) if data else None
             if session_data is not None:
-                session_data.update({
-                    'authenticated': bool(session_data['authenticated']),
-                    'capabilities': [Capability(cap) for cap in session_data['capabilities']],
-                    'pending_challenge':\
-                        AuthnChallenge.unmarshal(session_data['pending_challenge'])
-                        if session_data.get('pending_challenge') else None,
-                    'required_challenges':\
-                        [AuthnChallengeType(ct) for ct in session_data['required_challenges']],
-                    'user_profile_id': UUID(session_data['user_profile_id'])
-                                       if session_data.get('user_profile_id') else None,
-                })
+                session_data.update(self.unmarshal_mapping(session_data))
 
         super().__init__(identity, data=data, new=new, max_age=max_age)
+        # the encoded data the session was loaded from, with which its storage skips saving it
+        # unchanged
+        self.stored = None
+
+    async def load(self) -> 'AuthnSession':
+        "Returns the session itself, as `LazySession.load()` returns the session it loads."
+        return self
+
+    @staticmethod
+    def unmarshal_mapping(session_data: dict) -> dict:
+        "Returns the session's values decoded from their JSON representation in `session_data`."
+        return {
+            'authenticated': bool(session_data['authenticated']),
+            'capabilities': CapabilitySet.unmarshal(session_data['capabilities']),
+            'pending_challenge':\
+                AuthnChallenge.unmarshal(session_data['pending_challenge'])
+                if session_data.get('pending_challenge') else None,
+            'required_challenges':\
+                [AuthnChallengeType(ct) for ct in session_data['required_challenges']],
+            'user_profile_id': UUID(session_data['user_profile_id'])
+                               if session_data.get('user_profile_id') else None,
+        }
+
+    @classmethod
+    def restore(cls, identity, created: int, mapping: dict, max_age=None) -> 'AuthnSession':
+        "Returns the session of an already decoded `mapping`, which is copied."
+        if max_age is not None and int(time.time()) - created > max_age:
+            return cls(None, data=None, new=True, max_age=max_age)
+
+        session = cls(identity, data=None, new=False, max_age=max_age)
+        session._created = created
+        session._mapping = _copy_mapping(mapping)
+        return session
 
     @property
     def authenticated(self) -> bool:
@@ -77,7 +171,7 @@ class AuthnSession(BaseSession):
         self.changed()
 
     @property
-    def capabilities(self) -> list[Capability]:
+    def capabilities(self) -> CapabilitySet:
         return self._mapping['capabilities']
 
     @property
@@ -115,22 +209,153 @@ class AuthnSession(BaseSession):
         self.changed()
 
     def set_role(self, role: UserRole):
-        self._mapping['capabilities'] = []
-        self.add_capabilities(*RoleCapability[role])
+        self._mapping['capabilities'] = CapabilitySet(RoleCapabilityFlags[role])
+        self.changed()
 
     def add_capabilities(self, *caps):
-        self._mapping['capabilities'] = set(self._mapping['capabilities']) | set(caps)
+        flags = self._mapping['capabilities'].flags | capability_flags(caps)
+        self._mapping['capabilities'] = CapabilitySet(flags)
         self.changed()
 
     def remove_capabilities(self, *caps):
-        self._mapping['capabilities'] = set(self._mapping['capabilities']) - set(caps)
+        flags = self._mapping['capabilities'].flags & ~capability_flags(caps)
+        self._mapping['capabilities'] = CapabilitySet(flags)
         self.changed()
 
     def has_capabilities(self, *caps):
-        return set(caps) <= set(self._mapping['capabilities'])
+        return self._mapping['capabilities'].includes(capability_flags(caps))
+
+
+class LazySession(object):
+    """
+    Stands in for the session of `request` until `load()` loads it from its store; once loaded,
+    the session's attributes are read and set through the proxy. A session which is never
+    loaded costs no load and, as it is unchanged, no save. `requires()` loads the session it
+    checks.
+
+    Handlers ask for one by annotating an argument as `LazySession`; an argument annotated as
+    `AuthnSession` is given the session already loaded.
+    """
+
+    def __init__(self, request):
+        self.__dict__['_request'] = request
+        self.__dict__['_session'] = None
+
+    async def load(self) -> AuthnSession:
+        if self._session is None:
+            self.__dict__['_session'] = await aiohttp_session.get_session(self._request)
+        return self._session
+
+    @property
+    def loaded(self) -> bool:
+        return self._session is not None
+
+    def _loaded(self) -> AuthnSession:
+        if self._session is None:
+            raise RuntimeError("the session is used before it is loaded, by `await load()`")
+        return self._session
+
+    def __getattr__(self, name):
+        return getattr(self._loaded(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._loaded(), name, value)
+
+    def __getitem__(self, key):
+        return self._loaded()[key]
+
+    def __setitem__(self, key, value):
+        self._loaded()[key] = value
+
+    def __delitem__(self, key):
+        del self._loaded()[key]
+
+    def __contains__(self, key):
+        return key in self._loaded()
+
+    def __iter__(self):
+        return iter(self._loaded())
+
+    def __len__(self):
+        return len(self._loaded())
+
+
+def _copy_mapping(mapping: dict) -> dict:
+    # the values are mutated in place, e.g. a pending challenge's attempts, but not nested deeper
+    return {k: copy.copy(v) for k, v in mapping.items()}
 
 
 class RedisStorage(RedisStorage):
+    """
+    Sessions are serialized by `codec`, a `vocal.api.session_codec` codec.
+
+    With a `cache`, decoded sessions are also held in process, so that a session's repeat
+    requests skip the round trip to Redis and the decoding. Every save is published on
+    `invalidation_channel`, and once `subscribe()`d the cache evicts sessions saved by other
+    processes as it hears of them. While the subscription is down the cache is bypassed, and it
+    is emptied before it is used again, so that evictions published meanwhile can't be missed.
+    """
+
+    resubscribe_delay = 0.5
+    resubscribe_max_delay = 30.0
+
+    def __init__(self, redis_pool, *, codec, cache: Optional[LRUCache]=None, **kwargs):
+        super().__init__(redis_pool, **kwargs)
+        self._codec = codec
+        self._cache = cache
+        self._origin = uuid.uuid4().hex
+        self._listener = None
+        self._listening = False
+
+    @property
+    def invalidation_channel(self) -> str:
+        return self.cookie_name + '_invalidate'
+
+    async def subscribe(self, connect):
+        """
+        Evicts the sessions other processes publish as saved, until `close()`d. `connect` is
+        awaited for a Redis connection to subscribe on, and again each time it drops.
+        """
+        if self._cache is None:
+            return
+        # the first connection is opened here, so that an unreachable Redis fails the startup
+        conn = await connect()
+        self._listener = asyncio.ensure_future(self._evict(connect, conn))
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+
+    async def _evict(self, connect, conn):
+        delay = self.resubscribe_delay
+        while True:
+            try:
+                if conn is None:
+                    conn = await connect()
+                channel, = await conn.subscribe(self.invalidation_channel)
+                self._listening = True
+                delay = self.resubscribe_delay
+                async for message in channel.iter():
+                    origin, _, key = message.decode('utf-8').partition(':')
+                    if origin != self._origin:
+                        self._cache.pop(key)
+                logger.warning("session invalidation channel closed, resubscribing in %.1fs",
+                               delay)
+            except (OSError, aioredis.RedisError) as e:
+                logger.warning("session invalidation subscription failed, retrying in %.1fs: %r",
+                               delay, e)
+            finally:
+                # evictions published from now on would be missed
+                self._listening = False
+                self._cache.clear()
+                if conn is not None:
+                    conn.close()
+                    conn = None
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.resubscribe_max_delay)
+
     async def new_session(self):
         return AuthnSession(None, data=None, new=True, max_age=self.max_age)
 
@@ -138,19 +363,56 @@ class RedisStorage(RedisStorage):
         cookie = self.load_cookie(request)
         if cookie is None:
             return AuthnSession(None, data=None, new=True, max_age=self.max_age)
+
+        key = str(cookie)
+        if self._listening:
+            cached = self._cache.get(key)
+            if cached is not None:
+                created, mapping, stored = cached
+                session = AuthnSession.restore(key, created, mapping, max_age=self.max_age)
+                session.stored = stored
+                return session
+
+        # commands on the pool share its connections, rather than checking one out
+        stored = await self._redis.get(self.cookie_name + '_' + key)
+        if stored is None:
+            return AuthnSession(None, data=None, new=True, max_age=self.max_age)
+        try:
+            decoded = self._codec.decode(stored)
+        except ValueError:
+            return AuthnSession(key, data=None, new=False, max_age=self.max_age)
+        if decoded is None:
+            return AuthnSession(None, data=None, new=True, max_age=self.max_age)
+
+        created, mapping = decoded
+        session = AuthnSession.restore(key, created, mapping, max_age=self.max_age)
+        session.stored = stored
+        if self._listening:
+            self._cache.set(key, (created, mapping, stored))
+        return session
+
+    async def save_session(self, request, response, session):
+        data = self._codec.encode(self._get_session_data(session))
+        if session.identity is not None and data == session.stored:
+            return
+
+        key = session.identity
+        if key is None:
+            key = self._key_factory()
+            self.save_cookie(response, key, max_age=session.max_age)
         else:
-            with await self._redis as conn:
-                key = str(cookie)
-                data = await conn.get(self.cookie_name + '_' + key)
-                if data is None:
-                    return AuthnSession(None, data=None,
-                                   new=True, max_age=self.max_age)
-                data = data.decode('utf-8')
-                try:
-                    data = self._decoder(data)
-                except ValueError:
-                    data = None
-                return AuthnSession(key, data=data, new=False, max_age=self.max_age)
+            key = str(key)
+            self.save_cookie(response, '' if session.empty else key, max_age=session.max_age)
+
+        max_age = session.max_age
+        commands = [self._redis.set(self.cookie_name + '_' + key, data,
+                                    expire=max_age if max_age is not None else 0)]
+        if self._cache is not None and session.identity is not None:
+            self._cache.pop(key)
+            commands.append(self._redis.publish(self.invalidation_channel,
+                                                f'{self._origin}:{key}'))
+        # sent together, so that the commands cost one round trip
+        await asyncio.gather(*commands)
 
 
 class SimpleCookieStorage(SimpleCookieStorage):
@@ -167,14 +429,17 @@ class SimpleCookieStorage(SimpleCookieStorage):
 
 
 def requires(*capabilities):
+    flags = capability_flags(capabilities)
+
     def wrapper(handler):
         @wraps(handler)
-        async def f(request, __requires_session: AuthnSession, *args, **kwargs):
-            if not __requires_session.has_capabilities(*capabilities):
+        async def f(request, __requires_session: LazySession, *args, **kwargs):
+            session = await __requires_session.load()
+            if not session.capabilities.includes(flags):
                 raise HTTPForbidden()
             else:
                 return await handler(request, *args, **kwargs)
-        f.__annotations__['__requires_session'] = AuthnSession
+        f.__annotations__['__requires_session'] = LazySession
         return f
     return wrapper
 
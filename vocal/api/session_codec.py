@@ -0,0 +1,159 @@
+import json
+import struct
+from typing import Optional
+from uuid import UUID
+
+from vocal.api.models.authn import AuthnChallenge
+from vocal.api.security import AuthnSession, CapabilitySet
+from vocal.constants import AuthnChallengeType
+from vocal.util import json as vocal_json
+
+
+# a decoded session: when it was created, and its values
+Decoded = tuple[int, dict]
+
+
+# the position of a challenge type is its code, so challenge types may only be appended
+_challenge_types = list(AuthnChallengeType)
+_challenge_type_codes = {ct: i for i, ct in enumerate(_challenge_types)}
+
+_keys = frozenset(AuthnSession(None, data=None, new=True)._mapping)
+
+Version = 1
+
+# version, created, flags, capabilities
+_header = struct.Struct('>BqBQ')
+# challenge_id, challenge_type, attempts, len(hint), len(secret)
+_challenge = struct.Struct('>16sBHHH')
+
+_Authenticated = 0x01
+_UserProfileId = 0x02
+_PendingChallenge = 0x04
+
+
+class JsonCodec(object):
+    """
+    Serializes sessions as JSON, as the cookie storage does.
+
+    Every codec decodes sessions stored in either format: the first byte of the binary format is
+    its version, which a JSON object cannot begin with. Processes can so be switched from one
+    encoding to the other one at a time.
+    """
+
+    def encode(self, data: dict) -> bytes:
+        return vocal_json.encode_bytes(data)
+
+    def decode(self, stored: bytes) -> Optional[Decoded]:
+        "Returns the session `stored` was encoded from, or `None` if it is empty."
+        if stored[:1] != b'{':
+            try:
+                return self._decode(memoryview(stored))
+            except (IndexError, struct.error) as e:
+                raise ValueError(f"invalid session: {e}")
+
+        data = json.loads(stored)
+        if not data:
+            return None
+        try:
+            return int(data['created']), AuthnSession.unmarshal_mapping(data['session'])
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"invalid session: {e!r}")
+
+    def _decode(self, b: memoryview) -> Decoded:
+        version, created, flags, capabilities = _header.unpack_from(b)
+        if version != Version:
+            raise ValueError(f"unsupported session format: {version}")
+        offset = _header.size
+
+        user_profile_id = None
+        if flags & _UserProfileId:
+            user_profile_id = UUID(bytes=bytes(b[offset:offset + 16]))
+            offset += 16
+
+        n = b[offset]
+        required = [_challenge_types[code] for code in b[offset + 1:offset + 1 + n]]
+        offset += 1 + n
+
+        challenge = None
+        if flags & _PendingChallenge:
+            challenge_id, challenge_type, attempts, hint_len, secret_len =\
+                _challenge.unpack_from(b, offset)
+            offset += _challenge.size
+            hint = str(b[offset:offset + hint_len], 'utf-8')
+            offset += hint_len
+            secret = str(b[offset:offset + secret_len], 'utf-8')
+            offset += secret_len
+            challenge = AuthnChallenge(challenge_id=UUID(bytes=challenge_id),
+                                       challenge_type=_challenge_types[challenge_type],
+                                       hint=hint, secret=secret, attempts=attempts)
+
+        if offset != len(b):
+            raise ValueError("invalid session: length does not match its contents")
+
+        return created, {
+            'authenticated': bool(flags & _Authenticated),
+            'capabilities': CapabilitySet(capabilities),
+            'pending_challenge': challenge,
+            'required_challenges': required,
+            'user_profile_id': user_profile_id,
+        }
+
+
+class BinaryCodec(JsonCodec):
+    """
+    Serializes sessions in a compact binary format: capabilities as their flags, UUIDs as
+    their 16 bytes and enums as their position. Sessions stored as JSON are rewritten in the
+    binary format the next time they change.
+
+    A session which holds anything the format cannot represent is stored as JSON instead.
+    """
+
+    def encode(self, data: dict) -> bytes:
+        try:
+            return self._encode(data['created'], data['session'])
+        except (AttributeError, KeyError, ValueError, struct.error):
+            return super().encode(data)
+
+    def _encode(self, created: int, mapping: dict) -> bytes:
+        if mapping.keys() != _keys:
+            raise ValueError("not a session of known values")
+
+        capabilities = mapping['capabilities'].flags
+        flags = 0
+        if mapping['authenticated']:
+            flags |= _Authenticated
+        user_profile_id = mapping['user_profile_id']
+        if user_profile_id is not None:
+            flags |= _UserProfileId
+        challenge = mapping['pending_challenge']
+        if challenge is not None:
+            flags |= _PendingChallenge
+
+        required = mapping['required_challenges']
+        parts = [_header.pack(Version, created, flags, capabilities)]
+        if user_profile_id is not None:
+            parts.append(user_profile_id.bytes)
+        parts.append(struct.pack(f'>B{len(required)}B', len(required),
+                                 *(_challenge_type_codes[ct] for ct in required)))
+        if challenge is not None:
+            hint = challenge.hint.encode('utf-8')
+            secret = challenge.secret.encode('utf-8')
+            parts.append(_challenge.pack(challenge.challenge_id.bytes,
+                                         _challenge_type_codes[challenge.challenge_type],
+                                         challenge.attempts, len(hint), len(secret)))
+            parts.append(hint)
+            parts.append(secret)
+        return b''.join(parts)
+
+
+codecs = {
+    'json': JsonCodec,
+    'binary': BinaryCodec,
+}
+
+
+def codec(name: str) -> JsonCodec:
+    try:
+        return codecs[name]()
+    except KeyError:
+        raise ValueError(f"unsupported session encoding: {name}")
@@ -1,18 +1,51 @@
+import logging
+from contextlib import AsyncExitStack
+
 import sqlalchemy
 import sqlalchemy.ext.asyncio
 
+from .pool import PoolStatus, engine_options, pool_status
 from .record import BaseRecord, Recordset
+from .replica import ConnectionErrors, ReplicaSet
+
+
+logger = logging.getLogger(__name__)
 
 
 async def configure(appctx):
     appctx.declare('storage')
+    appctx.declare('storage_replicas')
 
     config = appctx.config.get()
     dbconf = config['storage']
+    poolconf = dbconf.get('pool', {})
+
+    engine = create_engine(dbconf['connection'], config['secrets']['storage'], poolconf)
+    appctx.storage.set(engine)
 
-    connargs = dbconf['connection']
-    connargs.update(config['secrets']['storage'])
+    replicas = [create_engine(rc['connection'], config['secrets']['storage'],
+                              rc.get('pool', poolconf))
+                for rc in dbconf.get('replicas', [])]
+    appctx.storage_replicas.set(ReplicaSet(replicas,
+                                           retry_after=dbconf.get('replica_retry_after', 30)))
+
+
+def create_engine(connargs: dict, secrets: dict, poolconf: dict
+                  ) -> sqlalchemy.ext.asyncio.AsyncEngine:
+    connargs = {**connargs, **secrets}
     dsn = sqlalchemy.engine.url.URL.create('postgresql+asyncpg', **connargs)
+    return sqlalchemy.ext.asyncio.create_async_engine(dsn, **engine_options(poolconf))
 
-    engine = sqlalchemy.ext.asyncio.create_async_engine(dsn)
-    appctx.storage.set(engine)
+
+async def prewarm(engine: sqlalchemy.ext.asyncio.AsyncEngine, connections: int):
+    """
+    Opens `connections` connections of `engine`'s pool, which are left idle in the pool, so that
+    the first requests do not wait on connection setup. A failure to connect is logged, not
+    raised: the pool connects on demand once the database is reachable.
+    """
+    try:
+        async with AsyncExitStack() as stack:
+            for _ in range(connections):
+                await stack.enter_async_context(engine.connect())
+    except ConnectionErrors as e:
+        logger.warning(f"could not prewarm {engine.url!r}: {e}")
@@ -0,0 +1,96 @@
+import base64
+import binascii
+import json
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from sqlalchemy.sql.expression import Select, bindparam, tuple_
+
+from vocal.api.message import PaginationStatus
+from vocal.api.storage.record import Recordset
+from vocal.api.storage.statement import StatementVariants
+
+
+@dataclass(frozen=True)
+class PageRequest:
+    size: int
+    token: Optional[str] = None
+
+    def __post_init__(self):
+        if self.size < 1:
+            raise ValueError(f"page size must be positive: {self.size}")
+
+
+def encode_token(key: tuple) -> str:
+    data = json.dumps([str(v) for v in key], separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_token(token: str) -> list[str]:
+    try:
+        data = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        key = json.loads(data)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError(f"invalid page token: {token}")
+    if not isinstance(key, list) or not all(isinstance(v, str) for v in key):
+        raise ValueError(f"invalid page token: {token}")
+    return key
+
+
+class KeysetPages(object):
+    """
+    Pages of a listing, in the order of a key which is unique per listed item.
+
+    `keys` selects the key columns from the table which drives the listing. A page of `stmt`
+    is restricted to the rows whose key is among the next `size + 1` keys after the page
+    token's, so each page costs an index range scan on the key no matter how deep it is. The
+    extra key tells `paginate()` whether there is a next page. `stmt` must be ordered by the
+    key first, so that the rows of each item are consecutive.
+
+    `filters` are optional `where` clauses on `keys`, as for `StatementVariants`.
+    """
+
+    def __init__(self, stmt: Select, keys: Select, **filters):
+        self._columns = tuple(keys.selected_columns)
+        key = tuple_(*self._columns)
+        after = key > tuple_(*[bindparam(f'after_{i}', type_=c.type)
+                               for i, c in enumerate(self._columns)])
+
+        self._keys = StatementVariants(keys.order_by(*self._columns).limit(bindparam('limit')),
+                                       after=after, **filters)
+        self._pages = {id(q): stmt.where(key.in_(q.correlate(None)))
+                       for q in self._keys.variants()}
+
+    def __call__(self, page: PageRequest, **params: Any) -> tuple[Select, dict[str, Any]]:
+        after = None
+        if page.token is not None:
+            values = decode_token(page.token)
+            if len(values) != len(self._columns):
+                raise ValueError(f"invalid page token: {page.token}")
+            after = [c.type.python_type(v) for c, v in zip(self._columns, values)]
+
+        q, params = self._keys(after=after, limit=page.size + 1, **params)
+        if params.pop('after', None) is not None:
+            params.update({f'after_{i}': v for i, v in enumerate(after)})
+        return self._pages[id(q)], params
+
+
+def paginate(recs: Recordset, key_fields: tuple[str, ...], page: PageRequest) -> Recordset:
+    """
+    Trims a result fetched with `KeysetPages` to the requested page size and returns it with
+    the token of the following page, if there is one.
+    """
+    keys = []
+    end = len(recs)
+    for i, rec in enumerate(recs):
+        key = tuple(getattr(rec, f) for f in key_fields)
+        if keys and keys[-1] == key:
+            continue
+        if len(keys) == page.size:
+            end = i
+            break
+        keys.append(key)
+
+    next_page = encode_token(keys[-1]) if end < len(recs) else None
+    return Recordset(list(recs[:end]),
+                     page=PaginationStatus(size=page.size, page=page.token, next_page=next_page))
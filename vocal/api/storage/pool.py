@@ -0,0 +1,80 @@
+import time
+from dataclasses import dataclass
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+@dataclass(frozen=True)
+class PoolStatus:
+    size: int
+    checked_out: int
+    idle: int
+    overflow: int
+    waiting: int
+    acquired: int
+    acquire_time_total: float
+    acquire_time_max: float
+
+    @property
+    def acquire_time_mean(self) -> float:
+        if self.acquired == 0:
+            return 0.0
+        return self.acquire_time_total / self.acquired
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    An `AsyncAdaptedQueuePool` which counts callers waiting on a connection and
+    records how long each checkout took, including any pre-ping.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._waiting = 0
+        self._acquired = 0
+        self._acquire_time_total = 0.0
+        self._acquire_time_max = 0.0
+
+    def connect(self):
+        self._waiting += 1
+        t0 = time.perf_counter()
+        try:
+            conn = super().connect()
+        finally:
+            self._waiting -= 1
+
+        elapsed = time.perf_counter() - t0
+        self._acquired += 1
+        self._acquire_time_total += elapsed
+        if elapsed > self._acquire_time_max:
+            self._acquire_time_max = elapsed
+        return conn
+
+    def stats(self) -> PoolStatus:
+        return PoolStatus(size=self.size(),
+                          checked_out=self.checkedout(),
+                          idle=self.checkedin(),
+                          overflow=max(self.overflow(), 0),
+                          waiting=self._waiting,
+                          acquired=self._acquired,
+                          acquire_time_total=self._acquire_time_total,
+                          acquire_time_max=self._acquire_time_max)
+
+
+def engine_options(poolconf: dict) -> dict:
+    return {
+        'poolclass': InstrumentedPool,
+        'pool_size': int(poolconf.get('size', 5)),
+        'max_overflow': int(poolconf.get('max_overflow', 10)),
+        'pool_recycle': int(poolconf.get('recycle', -1)),
+        'pool_pre_ping': bool(poolconf.get('pre_ping', False)),
+        'pool_timeout': float(poolconf.get('timeout', 30)),
+    }
+
+
+def pool_status(engine: AsyncEngine) -> PoolStatus:
+    pool = engine.sync_engine.pool
+    if not isinstance(pool, InstrumentedPool):
+        raise TypeError(f"engine is not using an instrumented pool: {pool!r}")
+    return pool.stats()
@@ -1,79 +1,109 @@
-from collections.abc import Sequence
-from typing import Any, Callable, Optional, List, Union
+from collections.abc import AsyncIterator, Sequence
+from enum import Enum
+from typing import Any, Callable, Optional, List, Union, get_args, get_origin
 
 import itertools
-from dataclasses import dataclass, field, asdict
 from datetime import datetime
 from decimal import Decimal
+from operator import itemgetter
 from uuid import UUID
 
 import sqlalchemy.exc
 from sqlalchemy.engine.result import Result
 from sqlalchemy.engine.row import Row
+from sqlalchemy.ext.asyncio import AsyncResult
 
+from vocal.api.message import PaginationStatus
 from vocal.constants import ContactMethodType, ISO4217Currency, SubscriptionPlanStatus,\
         PaymentDemandType, PaymentDemandPeriod, PaymentMethodStatus, PaymentMethodType, UserRole,\
         SubscriptionStatus
-
-
-class Recordset(Sequence):
-    def __init__(self, records: list['BaseRecord']):
-        self._records = records
-
-    def __len__(self):
-        return self._records.__len__()
-
-    def __getitem__(self, index):
-        return self._records.__getitem__(index)
-
-    def group_by(self, field_name: str) -> dict[Any, list['BaseRecord']]:
-        r = {}
-        for rec in self._records:
-            v = getattr(rec, field_name)
-            r.setdefault(v, []).append(rec)
-        return r
-
-    def find(self, keyf: Callable[['BaseRecord'], bool]=None, **kwargs):
-        if keyf is not None:
-            for rec in self._records:
-                if keyf(rec):
-                    return rec
+from vocal.util.indexed import IndexedSequence
+
+
+StreamPartitionSize = 500
+
+
+class Recordset(IndexedSequence):
+    def __init__(self, records: list['BaseRecord'], page: Optional[PaginationStatus]=None):
+        super().__init__(records)
+        self.page = page
+
+
+class RecordType(type):
+    """
+    Lays out a record class as a tuple of its annotated fields, in declaration order and after
+    the fields of its base record class, with a read-only property for each field. Records have
+    no instance `__dict__`.
+    """
+
+    def __new__(mcls, name, bases, ns):
+        fields = tuple(f for base in bases for f in getattr(base, '_fields', ()))
+        converters = tuple(c for base in bases for c in getattr(base, '_converters', ()))
+        own = ns.get('__annotations__', {})
+        for i, (fname, t) in enumerate(own.items(), start=len(fields)):
+            ns[fname] = property(itemgetter(i), doc=f"field {i}: {fname}")
+            convert = column_converter(t)
+            if convert is not None:
+                converters += ((i, convert),)
+        ns['_fields'] = fields + tuple(own)
+        ns['_converters'] = converters
+        ns.setdefault('__slots__', ())
+        return super().__new__(mcls, name, bases, ns)
+
+
+def column_converter(t: Any) -> Optional[Callable[[Any], Any]]:
+    """
+    Returns the function which converts a non-`None` column value to a field of type `t`, or
+    `None` if the value can be used as-is. Only enum fields are converted, by a dict lookup of
+    the member for a value; values which are already members pass through.
+    """
+    if get_origin(t) is Union:
+        args = [a for a in get_args(t) if a is not type(None)]
+        if len(args) != 1:
             return None
+        t = args[0]
+
+    if isinstance(t, type) and issubclass(t, Enum):
+        members = t._value2member_map_
+
+        def convert(v):
+            if v.__class__ is t:
+                return v
+            try:
+                return members[v]
+            except KeyError:
+                raise ValueError(f"{v!r} is not a valid {t.__qualname__}") from None
+        return convert
+    return None
+
+
+class BaseRecord(tuple, metaclass=RecordType):
+    def __new__(cls, *values, **kwargs):
+        if kwargs:
+            try:
+                values += tuple(kwargs.pop(f) for f in cls._fields[len(values):])
+            except KeyError as e:
+                raise TypeError(f"{cls.__name__}() missing field {e}") from None
+            if kwargs:
+                raise TypeError(f"{cls.__name__}() got unexpected fields {tuple(kwargs)}")
+        if len(values) != len(cls._fields):
+            raise TypeError(f"{cls.__name__}() takes {len(cls._fields)} fields, "
+                            f"got {len(values)}")
+        return tuple.__new__(cls, values)
+
+    def __getnewargs__(self):
+        return tuple(self)
+
+    # records of different classes are never equal, even if their values are
+    def __eq__(self, other):
+        return self.__class__ is other.__class__ and tuple.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.__class__, tuple.__hash__(self)))
 
-        elif kwargs:
-            for rec in self._records:
-                match = False
-                for key, val in kwargs.items():
-                    match = (getattr(rec, key) == val)
-                if match:
-                    return rec
-
-        raise RuntimeError("find() must be called with key function or kwargs")
-
-    def find_all(self, keyf: Callable[['BaseRecord'], bool]=None, **kwargs):
-        results = []
-        if keyf is not None:
-            for rec in self._records:
-                if keyf(rec):
-                    results.append(rec)
-            return results
-
-        elif kwargs:
-            for rec in self._records:
-                match = False
-                for key, val in kwargs.items():
-                    match = (getattr(rec, key) == val)
-                if match:
-                    results.append(rec)
-            return results
-
-        raise RuntimeError("find() must be called with key function or kwargs")
-
-    def __repr__(self):
-        return f"<{self.__class__.__name__} {self._records}>"
-
-
-class BaseRecord(object):
     @classmethod
     def group_logical(cls, rs: Result) -> List[Row]:
         return rs.all()
@@ -90,17 +120,55 @@ class BaseRecord(object):
         if single:
             return cls.unmarshal_single_result(rs)
         else:
-            return Recordset([cls.unmarshal_row(row) for row in rs.all()])
+            return Recordset(cls.unmarshal_rows(rs.all()))
+
+    @classmethod
+    async def stream_result(cls, rs: AsyncResult) -> AsyncIterator['BaseRecord']:
+        """
+        Unmarshals a streamed result, fetching at most `StreamPartitionSize` rows from the cursor
+        at a time.
+        """
+        async for partition in rs.partitions(StreamPartitionSize):
+            for rec in cls.unmarshal_rows(partition):
+                yield rec
+
+    @classmethod
+    def unmarshal_rows(cls, rows: Sequence[Row]) -> list['BaseRecord']:
+        """
+        Constructs a record from each row, whose columns must be the record's fields in order,
+        applying the class's column converters.
+        """
+        if rows and len(rows[0]) != len(cls._fields):
+            raise TypeError(f"{cls.__name__} takes {len(cls._fields)} fields, "
+                            f"got {len(rows[0])}")
+
+        new = tuple.__new__
+        converters = cls._converters
+        if not converters:
+            return [new(cls, row) for row in rows]
+
+        recs = []
+        for row in rows:
+            values = list(row)
+            for i, convert in converters:
+                v = values[i]
+                if v is not None:
+                    values[i] = convert(v)
+            recs.append(new(cls, values))
+        return recs
 
     @classmethod
     def unmarshal_row(cls, row: Row) -> 'BaseRecord':
-        raise NotImplementedError()
+        return cls.unmarshal_rows((row,))[0]
 
     def marshal_dict(self) -> dict:
-        return asdict(self)
+        return dict(zip(self._fields, self))
+
+    def __repr__(self):
+        fields = ', '.join(f'{f}={v!r}' for f, v in zip(self._fields, self))
+        return f"{self.__class__.__name__}({fields})"
 
 
-@dataclass(frozen=True)
 class UserProfileRecord(BaseRecord):
     user_profile_id: UUID
     display_name: str
@@ -114,22 +182,7 @@ class UserProfileRecord(BaseRecord):
     phone_number_contact_method_verified: Optional[bool]
     phone_number: Optional[str]
 
-    @classmethod
-    def unmarshal_row(cls: 'UserProfileRecord', row: Row) -> 'UserProfileRecord':
-        return UserProfileRecord(user_profile_id=row[0],
-                                 display_name=row[1],
-                                 created_at=row[2],
-                                 name=row[3],
-                                 role=UserRole(row[4]),
-                                 email_contact_method_id=row[5],
-                                 email_contact_method_verified=row[6],
-                                 email_address=row[7],
-                                 phone_number_contact_method_id=row[8],
-                                 phone_number_contact_method_verified=row[9],
-                                 phone_number=row[10])
-
-
-@dataclass(frozen=True)
+
 class SubscriberUserProfileRecord(UserProfileRecord):
     subscription_plan_id: UUID
     rank: Optional[int]
@@ -149,27 +202,14 @@ class SubscriberUserProfileRecord(UserProfileRecord):
     current_status_at: datetime
     current_status_until: Optional[datetime]
 
-    @classmethod
-    def unmarshal_row(cls, row: Row) -> 'SubscriberUserProfileRecord':
-        return cls(*row)
-
 
-@dataclass(frozen=True)
 class PaymentProfileRecord(BaseRecord):
     user_profile_id: UUID
     payment_profile_id: UUID
     processor_id: str
     processor_customer_profile_id: str
 
-    @classmethod
-    def unmarshal_row(cls, row: Row) -> 'PaymentProfileRecord':
-        return cls(user_profile_id=row[0],
-                   payment_profile_id=row[1],
-                   processor_id=row[2],
-                   processor_customer_profile_id=row[3])
-
 
-@dataclass(frozen=True)
 class PaymentMethodRecord(BaseRecord):
     user_profile_id: UUID
     payment_profile_id: UUID
@@ -184,29 +224,17 @@ class PaymentMethodRecord(BaseRecord):
     status: PaymentMethodStatus
     expires_after: datetime
 
-    @classmethod
-    def unmarshal_row(cls, row: Row) -> 'PaymentMethodRecord':
-        return cls(user_profile_id=row[0],
-                   payment_profile_id=row[1],
-                   processor_id=row[2],
-                   processor_customer_profile_id=row[3],
-                   payment_method_id=row[4],
-                   processor_payment_method_id=row[5],
-                   payment_method_type=PaymentMethodType(row[6]),
-                   payment_method_family=row[7],
-                   display_name=row[8],
-                   safe_account_number_fragment=row[9],
-                   status=PaymentMethodStatus(row[10]),
-                   expires_after=row[11])
-
-
-@dataclass(frozen=True)
+
 class ContactMethodRecord(BaseRecord):
     user_profile_id: UUID
     contact_method_id: UUID
     contact_method_type: ContactMethodType.Email
     verified: bool
 
+    @classmethod
+    def unmarshal_rows(cls, rows: Sequence[Row]) -> list['ContactMethodRecord']:
+        return [cls.unmarshal_row(row) for row in rows]
+
     @classmethod
     def unmarshal_row(cls, row: Row) -> 'ContactMethodRecord':
         cmtype = ContactMethodType(row[3])
@@ -218,7 +246,6 @@ class ContactMethodRecord(BaseRecord):
             raise ValueError(cmtype)
 
 
-@dataclass(frozen=True)
 class EmailContactMethodRecord(ContactMethodRecord):
     email_address: str
 
@@ -233,7 +260,6 @@ class EmailContactMethodRecord(ContactMethodRecord):
                                         email_address=row[4])
 
 
-@dataclass(frozen=True)
 class PhoneContactMethodRecord(ContactMethodRecord):
     phone_number: str
 
@@ -248,7 +274,6 @@ class PhoneContactMethodRecord(ContactMethodRecord):
                                         phone_number=row[4])
 
 
-@dataclass(frozen=True)
 class SubscriptionPlanPaymentDemandRecord(BaseRecord):
     subscription_plan_id: UUID
     status: SubscriptionPlanStatus
@@ -279,27 +304,24 @@ class SubscriptionPlanPaymentDemandRecord(BaseRecord):
         groups = cls.group_logical(rs)
         if len(groups) > 1:
             raise sqlalchemy.exc.MultipleResultsFound()
-        return Recordset([cls.unmarshal_row(g) for g in groups[0]])
+        return Recordset(cls.unmarshal_rows(groups[0]))
 
     @classmethod
-    def unmarshal_row(cls: 'SubscriptionPlanPaymentDemandRecord',
-                      row: Row,
-                      ) -> 'SubscriptionPlanPaymentDemandRecord':
-        return SubscriptionPlanPaymentDemandRecord(
-            subscription_plan_id=row[0],
-            status=SubscriptionPlanStatus(row[1]),
-            rank=row[2],
-            subscription_plan_name=row[3],
-            description=row[4],
-            payment_demand_id=row[5],
-            demand_type=PaymentDemandType(row[6]),
-            period=PaymentDemandPeriod(row[7]) if row[7] else None,
-            amount=row[8],
-            iso_currency=ISO4217Currency(row[9]) if row[9] else None,
-            non_iso_currency=row[10])
-
-
-@dataclass(frozen=True)
+    async def stream_result(cls, rs: AsyncResult) -> AsyncIterator[Recordset]:
+        """
+        Yields a `Recordset` for each plan in a streamed result. The rows of a plan must be
+        consecutive, i.e. the query must be ordered by `subscription_plan_id` first.
+        """
+        group = []
+        async for rec in super().stream_result(rs):
+            if group and rec.subscription_plan_id != group[0].subscription_plan_id:
+                yield Recordset(group)
+                group = []
+            group.append(rec)
+        if group:
+            yield Recordset(group)
+
+
 class SubscriptionRecord(BaseRecord):
     user_profile_id: UUID
     subscription_plan_id: UUID
@@ -310,7 +332,3 @@ class SubscriptionRecord(BaseRecord):
     status: SubscriptionStatus
     started_at: datetime
     current_status_until: Optional[datetime]
-
-    @classmethod
-    def unmarshal_row(cls, row: Row) -> 'SubscriptionRecord':
-        return cls(*row)
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.sql.expression import literal, select
+
+
+logger = logging.getLogger(__name__)
+
+RoutingKey = 'vocal.replica_routing'
+ConnectionErrors = (DBAPIError, PoolTimeoutError, OSError, asyncio.TimeoutError)
+
+
+class ReplicaSet(object):
+    """
+    Round-robins read-only sessions across a set of replica engines.
+
+    A replica which fails to connect is taken out of rotation for `retry_after` seconds, after
+    which it is tried again. When no replica is available reads fall back to the primary.
+    """
+
+    def __init__(self, engines: list[AsyncEngine], retry_after: float=30.0):
+        self._engines = list(engines)
+        self._retry_after = retry_after
+        self._down_until = {}
+        self._next = 0
+
+    def __len__(self):
+        return len(self._engines)
+
+    def available(self) -> list[AsyncEngine]:
+        now = time.monotonic()
+        return [e for e in self._engines if self._down_until.get(e, 0) <= now]
+
+    def choose(self) -> Optional[AsyncEngine]:
+        engines = self.available()
+        if not engines:
+            return None
+        self._next = (self._next + 1) % len(engines)
+        return engines[self._next]
+
+    def mark_down(self, engine: AsyncEngine):
+        logger.warning(f"replica {engine.url!r} is unavailable, retrying in {self._retry_after}s")
+        self._down_until[engine] = time.monotonic() + self._retry_after
+
+    def mark_up(self, engine: AsyncEngine):
+        self._down_until.pop(engine, None)
+
+    async def check(self):
+        "Probes every replica and updates its availability."
+        for engine in self._engines:
+            try:
+                async with engine.connect() as conn:
+                    await conn.execute(select(literal(1)))
+            except ConnectionErrors:
+                self.mark_down(engine)
+            else:
+                self.mark_up(engine)
+
+    async def dispose(self):
+        for engine in self._engines:
+            await engine.dispose()
+
+
+class _routing(object):
+    def __init__(self, replicas: ReplicaSet):
+        self.replicas = replicas
+        self.pinned = False
+        self.reader = None
+
+    async def open_reader(self) -> Optional[AsyncSession]:
+        while True:
+            engine = self.replicas.choose()
+            if engine is None:
+                return None
+
+            s = AsyncSession(engine)
+            try:
+                await s.connection()
+            except ConnectionErrors:
+                await s.close()
+                self.replicas.mark_down(engine)
+            else:
+                return s
+
+
+@asynccontextmanager
+async def routing(replicas: Optional[ReplicaSet], session: AsyncSession):
+    """
+    Enables replica routing of read-only operations executed in `session` for the duration of
+    the context. The replica session, if one is opened, is closed on exit.
+    """
+    if not replicas:
+        yield session
+        return
+
+    state = session.sync_session.info[RoutingKey] = _routing(replicas)
+    try:
+        yield session
+    finally:
+        del session.sync_session.info[RoutingKey]
+        if state.reader is not None:
+            await state.reader.close()
+
+
+async def reader(session: AsyncSession) -> AsyncSession:
+    """
+    Returns the session in which a read-only operation should execute: a replica session when
+    routing is enabled and `session` has not yet written, otherwise `session` itself.
+    """
+    state = session.sync_session.info.get(RoutingKey)
+    if state is None or state.pinned:
+        return session
+
+    if state.reader is None:
+        state.reader = await state.open_reader()
+        if state.reader is None:
+            state.pinned = True
+            return session
+    return state.reader
+
+
+def mark_written(session: AsyncSession):
+    "Pins all further operations executed in `session` to the primary."
+    state = session.sync_session.info.get(RoutingKey)
+    if state is not None:
+        state.pinned = True
@@ -0,0 +1,43 @@
+import itertools
+from typing import Any
+
+from sqlalchemy.sql.expression import ClauseElement, Select
+
+
+class StatementVariants(object):
+    """
+    Every combination of a base statement and a set of optional `where` clauses,
+    built once and reused for the life of the process.
+
+    Filters must compare against `bindparam()`s named after the filter, so that
+    each variant renders the same SQL on every call. This lets SQLAlchemy's
+    compiled cache skip compilation and asyncpg reuse its prepared statements.
+    """
+
+    def __init__(self, stmt: Select, **filters: ClauseElement):
+        self._filters = tuple(filters)
+        self._variants = {}
+        for n in range(len(self._filters) + 1):
+            for names in itertools.combinations(self._filters, n):
+                q = stmt
+                for name in names:
+                    q = q.where(filters[name])
+                self._variants[frozenset(names)] = q
+
+    def __call__(self, **params: Any) -> tuple[Select, dict[str, Any]]:
+        """
+        Returns the variant selected by which optional filters have a non-`None`
+        value in `params`, and the parameters to execute it with.
+        """
+        key = frozenset(name for name in self._filters if params.get(name) is not None)
+        return self._variants[key], {k: v for k, v in params.items()
+                                     if v is not None or k not in self._filters}
+
+    def variants(self) -> list[Select]:
+        return list(self._variants.values())
+
+    def __len__(self):
+        return len(self._variants)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self._filters}>"
@@ -1,21 +1,28 @@
 import math
 import random
 import warnings
+from collections.abc import AsyncIterator
 from http import HTTPStatus
 from functools import wraps, partial
+from typing import Optional, Union
 
-from aiohttp.web import Response, json_response, middleware
+from aiohttp.web import Response, json_response
 from aiohttp.web_exceptions import HTTPException
 from sqlalchemy.engine.result import Result
 from sqlalchemy.exc import NoResultFound
 
 from vocal.api.message import ErrorMessage, MessageStatus, ResultMessage, ScalarResultMessage,\
-        VectorResultMessage, PagedResultMessage
+        VectorResultMessage, Page, PagedResultMessage, StreamedResultMessage
 from vocal.api.models.base import ViewModel
+from vocal.api.storage import replica
+from vocal.api.storage.page import PageRequest, paginate
 from vocal.api.storage.record import BaseRecord, Recordset
 from vocal.util import json
 
 
+OkStatus = MessageStatus(success=True, message=HTTPStatus(200).phrase)
+
+
 def message(handler):
     @wraps(handler)
     async def f(*args, **kwargs):
@@ -28,71 +35,96 @@ def message(handler):
         except ValueError as e:
             resp = e
 
-        if isinstance(resp, (type(None), str, ViewModel)):
-            status = MessageStatus(success=True, message=HTTPStatus(200).phrase)
-            return ScalarResultMessage(status=status, data=resp)
-        elif isinstance(resp, (list, dict)):
-            status = MessageStatus(success=True, message=HTTPStatus(200).phrase)
-            return VectorResultMessage(status=status, data=resp)
-        elif isinstance(resp, (Response, HTTPException)) or isinstance(resp, tuple):
-            if isinstance(resp, tuple):
-                resp, obj = resp
-            else:
-                obj = None
-
-            errors = []
-            if obj is None:
-                if isinstance(resp, HTTPException):
-                    if resp.status >= 400:
-                        errors.append(ErrorMessage(message=resp.text))
-                    if not isinstance(resp.body, (str, bytes)):
-                        obj = resp.body
-                else:
-                    obj = resp.body or resp.data
-
-            success = (200 <= resp.status < 300)
-            status = MessageStatus(success=success, message=resp.reason, errors=errors)
-            resp.headers.pop('Content-Type')
-
-            if isinstance(obj, (list, dict)):
-                return json_response(VectorResultMessage(status=status, data=obj),
-                                     status=resp.status,
-                                     reason=resp.reason,
-                                     dumps=json.encode,
-                                     headers=resp.headers)
-            else:
-                return json_response(ScalarResultMessage(status=status, data=obj),
-                                     status=resp.status,
-                                     reason=resp.reason,
-                                     dumps=json.encode,
-                                     headers=resp.headers)
-        elif isinstance(resp, ValueError):
-            reason = "Validation Failed"
-            body = {
-                'status': {
-                    'success': False,
-                    'message': reason,
-                    'errors': [str(resp)]
-                }
-            }
-            status = MessageStatus(success=False, message=reason,
-                                   errors=[ErrorMessage(message=str(resp))])
-            return json_response(ResultMessage(status=status), status=400,
-                                 reason=reason, dumps=json.encode)
-        else:
-            try:
-                status = MessageStatus(success=True, message=HTTPStatus(200).phrase)
-                return ScalarResultMessage(status=status, data=resp)
-            except Exception:
-                status = MessageStatus(success=False, message="unknown response type")
-                return json_response(ResultMessage(status=status), status=500, dumps=json.encode)
+        return envelope(resp)
     return f
 
 
-@middleware
-async def message_middleware(request, handler):
-    wrapper = message(handler)
-    return await wrapper(request)
+def marshal_records(data: Union[list, dict]) -> Union[list, dict]:
+    """
+    Returns `data`, a list or dict a handler returned, with the records among its items or
+    values replaced by their dicts; the encoder would serialize them as arrays, being tuples.
+    `data` is returned as-is if it holds no record.
+    """
+    values = data.values() if isinstance(data, dict) else data
+    if not any(isinstance(v, BaseRecord) for v in values):
+        return data
+    if isinstance(data, dict):
+        return {k: v.marshal_dict() if isinstance(v, BaseRecord) else v for k, v in data.items()}
+    return [v.marshal_dict() if isinstance(v, BaseRecord) else v for v in data]
+
+
+def envelope(resp):
+    """
+    Wraps a handler's result, or the `HTTPException` or `ValueError` it raised, in a
+    `ResultMessage`, or in a JSON response carrying one when the status is not 200.
+    """
+    if isinstance(resp, (type(None), str, ViewModel)):
+        return ScalarResultMessage(status=OkStatus, data=resp)
+    elif isinstance(resp, BaseRecord):
+        return ScalarResultMessage(status=OkStatus, data=resp.marshal_dict())
+    elif isinstance(resp, Recordset):
+        data = [rec.marshal_dict() for rec in resp]
+        if resp.page is not None:
+            return PagedResultMessage(status=OkStatus, data=data, page=resp.page)
+        return VectorResultMessage(status=OkStatus, data=data)
+    elif isinstance(resp, Page) and resp.pagination is not None:
+        return PagedResultMessage(status=OkStatus, data=marshal_records(resp),
+                                  page=resp.pagination)
+    elif isinstance(resp, (list, dict)):
+        return VectorResultMessage(status=OkStatus, data=marshal_records(resp))
+    elif isinstance(resp, AsyncIterator):
+        return StreamedResultMessage(status=OkStatus, data=resp)
+    elif isinstance(resp, (Response, HTTPException)) or isinstance(resp, tuple):
+        if isinstance(resp, tuple):
+            resp, obj = resp
+        else:
+            obj = None
+
+        errors = []
+        if obj is None:
+            if isinstance(resp, HTTPException):
+                if resp.status >= 400:
+                    errors.append(ErrorMessage(message=resp.text))
+                if not isinstance(resp.body, (str, bytes)):
+                    obj = resp.body
+            else:
+                obj = resp.body or resp.data
+
+        success = (200 <= resp.status < 300)
+        status = MessageStatus(success=success, message=resp.reason, errors=errors)
+        resp.headers.pop('Content-Type')
+
+        if isinstance(obj, (list, dict)):
+            return json_response(VectorResultMessage(status=status, data=obj),
+                                 status=resp.status,
+                                 reason=resp.reason,
+                                 dumps=json.encode,
+                                 headers=resp.headers)
+        else:
+            return json_response(ScalarResultMessage(status=status, data=obj),
+                                 status=resp.status,
+                                 reason=resp.reason,
+                                 dumps=json.encode,
+                                 headers=resp.headers)
+    elif isinstance(resp, ValueError):
+        reason = "Validation Failed"
+        body = {
+            'status': {
+                'success': False,
+                'message': reason,
+                'errors': [str(resp)]
+            }
+        }
+        status = MessageStatus(success=False, message=reason,
+                               errors=[ErrorMessage(message=str(resp))])
+        return json_response(ResultMessage(status=status), status=400,
+                             reason=reason, dumps=json.encode)
+    else:
+        try:
+            return ScalarResultMessage(status=OkStatus, data=resp)
+        except Exception:
+            status = MessageStatus(success=False, message="unknown response type")
+            return json_response(ResultMessage(status=status), status=500, dumps=json.encode)
 
 
 def operation(impl=None, **impl_kwargs):
@@ -112,10 +144,13 @@ def operation(impl=None, **impl_kwargs):
     return f
 
 
+InvalidatesKey = 'vocal.invalidates'
+
+
 _notset = object()
 class operation_impl(object):
     def __init__(self, impl, *args, single_result=False, record_cls=None,
-                 default=_notset, **kwargs):
+                 default=_notset, readonly=False, page_key=None, invalidates=None, **kwargs):
         self._impl = impl
         self._args = args
         self._kwargs = kwargs
@@ -123,6 +158,9 @@ class operation_impl(object):
         self._record_cls = record_cls
         self._returning_cls = None
         self._single_result = single_result
+        self._readonly = readonly
+        self._page_key = page_key
+        self._invalidates = invalidates
 
         self._return_default = default is not _notset
         self._default = default
@@ -132,7 +170,15 @@ class operation_impl(object):
             raise RuntimeError("attempted double execution of operation")
         self._executed = True
 
+        if self._readonly:
+            session = await replica.reader(session)
+        else:
+            replica.mark_written(session)
+
         rs = await self._impl(session, *self._args, **self._kwargs)
+        if self._invalidates is not None:
+            session.sync_session.info.setdefault(InvalidatesKey, set()).add(self._invalidates)
+
         if self._record_cls is not None:
             try:
                 recs = self._record_cls.unmarshal_result(rs, single=self._single_result)
@@ -146,6 +192,10 @@ class operation_impl(object):
         else:
             recs = rs
 
+        page = self._kwargs.get('page')
+        if self._page_key is not None and page is not None:
+            recs = paginate(recs, self._page_key, page)
+
         if self._returning_cls is not None:
             if isinstance(recs, BaseRecord):
                 return self._returning_cls.unmarshal_record(recs)
@@ -153,9 +203,43 @@ class operation_impl(object):
                 recset = self._returning_cls.unmarshal_recordset(recs)
                 if self._single_result:
                     return recset[0]
+                if recs.page is not None:
+                    recset.page = recs.page
                 return recset
         return recs
 
+    def stream(self, session) -> AsyncIterator:
+        """
+        Executes the operation on a server-side cursor and returns an async iterator over its
+        records, or over the `ViewModel`s given to `unmarshal_with()`. Only operations whose impl
+        returns the result of a single `session.execute()` can be streamed.
+        """
+        if self._record_cls is None or self._single_result:
+            raise TypeError(f"{self!r} cannot be streamed")
+        if self._executed:
+            raise RuntimeError("attempted double execution of operation")
+        self._executed = True
+        return self._stream(session)
+
+    async def _stream(self, session):
+        if self._readonly:
+            session = await replica.reader(session)
+        else:
+            replica.mark_written(session)
+
+        rs = await self._impl(_streaming_session(session), *self._args, **self._kwargs)
+        try:
+            async for recs in self._record_cls.stream_result(rs):
+                if self._returning_cls is None:
+                    yield recs
+                elif isinstance(recs, BaseRecord):
+                    yield self._returning_cls.unmarshal_record(recs)
+                else:
+                    for obj in self._returning_cls.unmarshal_recordset(recs):
+                        yield obj
+        finally:
+            await rs.close()
+
     def unmarshal_with(self, rcls: 'ViewModel') -> 'operation_impl':
         self._returning_cls = rcls
         return self
@@ -164,6 +248,40 @@ class operation_impl(object):
         return f"<operation {self._impl.__name__} *{self._args}, **{self._kwargs}>"
 
 
+class _streaming_session(object):
+    "Presents `AsyncSession.stream()` to an operation impl as `execute()`."
+
+    def __init__(self, session):
+        self._session = session
+
+    def execute(self, *args, **kwargs):
+        return self._session.stream(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+
+def page_request(request, appctx) -> Optional[PageRequest]:
+    """
+    Reads the `page` token and `page_size` query parameters of a listing request, or returns
+    `None` if neither was sent and the whole listing is requested, as before listings were
+    paged. The size defaults to and is bounded by the `pagination` configuration.
+    """
+    if 'page' not in request.query and 'page_size' not in request.query:
+        return None
+
+    pconf = appctx.config.get().get('pagination', {})
+    max_size = int(pconf.get('max_size', 200))
+    size = request.query.get('page_size', pconf.get('default_size', 50))
+    try:
+        size = int(size)
+    except ValueError:
+        raise ValueError(f"invalid page_size: {size}")
+    if not 0 < size <= max_size:
+        raise ValueError(f"page_size must be between 1 and {max_size}")
+    return PageRequest(size=size, token=request.query.get('page'))
+
+
 def generate_otp(n=6):
     return ''.join([random.choice("0123456789") for i in range(n)])
 
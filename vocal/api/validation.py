@@ -0,0 +1,112 @@
+import json
+from pathlib import Path
+from typing import Any, Callable
+
+import yaml
+from aiohttp.web import HTTPRequestEntityTooLarge
+
+from vocal.util.schema import compile_schema
+
+
+class RequestBodies(object):
+    """
+    Validators of JSON request bodies, compiled once from the `requestBodies` of the OpenAPI
+    spec, which is the one definition of what each request may contain.
+
+    A body is checked against the size limit, and that it is a JSON object or array as its
+    schema requires, before it is decoded.
+    """
+
+    def __init__(self, path: Path, max_size: int=64 * 1024):
+        self._path = Path(path)
+        self._max_size = max_size
+        self._documents = {}
+
+        bodies = self._document(self._path.name)
+        self._validators = {}
+        self._openers = {}
+        for name, body in bodies.items():
+            schema = body.get('content', {}).get('application/json', {}).get('schema')
+            if schema is None:
+                continue
+            schema = _absolute(schema, self._path.name)
+            self._validators[name] = compile_schema(schema, self._resolve, name=name)
+            self._openers[name] = _openers.get(self._type(schema))
+
+    def validator(self, name: str) -> Callable[[Any], Any]:
+        return self._validators[name]
+
+    async def read(self, request, name: str) -> Any:
+        "Reads, decodes and validates the body of `request` as request body `name`."
+        validate = self._validators[name]
+
+        if request.content_length is not None and request.content_length > self._max_size:
+            raise HTTPRequestEntityTooLarge(max_size=self._max_size,
+                                            actual_size=request.content_length)
+        body = await request.read()
+        if len(body) > self._max_size:
+            raise HTTPRequestEntityTooLarge(max_size=self._max_size, actual_size=len(body))
+
+        opener = self._openers[name]
+        if opener is not None and body.lstrip()[:1] != opener:
+            raise ValueError(f"request body must be a JSON {_kinds[opener]}")
+        return validate(json.loads(body))
+
+    def _document(self, filename: str) -> dict:
+        try:
+            return self._documents[filename]
+        except KeyError:
+            pass
+        with open(self._path.parent / filename) as f:
+            doc = self._documents[filename] = yaml.safe_load(f)
+        return doc
+
+    def _resolve(self, ref: str) -> dict:
+        "Resolves a `$ref` made absolute by `_absolute()`, i.e. `file.yaml#/Name`."
+        filename, _, pointer = ref.partition('#')
+        node = self._document(filename)
+        for part in filter(None, pointer.split('/')):
+            node = node[part]
+        return _absolute(node, filename)
+
+    def _type(self, schema: dict):
+        while '$ref' in schema:
+            schema = self._resolve(schema['$ref'])
+        return schema.get('type')
+
+
+_openers = {'object': b'{', 'array': b'['}
+_kinds = {b'{': 'object', b'[': 'array'}
+
+
+def _absolute(schema, filename: str):
+    "Rewrites the `$ref`s in a schema read from `filename` to name the file they refer to."
+    if isinstance(schema, list):
+        return [_absolute(s, filename) for s in schema]
+    if not isinstance(schema, dict):
+        return schema
+
+    schema = {k: _absolute(v, filename) for k, v in schema.items()}
+    ref = schema.get('$ref')
+    if isinstance(ref, str):
+        target, _, pointer = ref.partition('#')
+        schema['$ref'] = f"{Path(target).name if target else filename}#{pointer}"
+    return schema
+
+
+async def configure(appctx):
+    config = appctx.config.get()
+    vconf = config.get('validation', {})
+
+    appctx.declare('request_bodies')
+    appctx.request_bodies.set(
+        RequestBodies(vconf.get('request_bodies', 'openapi/requestBodies.yaml'),
+                      max_size=int(vconf.get('max_body_size', 64 * 1024))))
+
+
+async def request_body(request, appctx, name: str) -> Any:
+    """
+    Returns the validated body of `request`, as request body `name` of the OpenAPI spec, with its
+    `uuid` and `decimal` strings already converted to `UUID`s and `Decimal`s.
+    """
+    return await appctx.request_bodies.get().read(request, name)
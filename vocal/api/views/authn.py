@@ -3,6 +3,7 @@ from aiohttp.web import HTTPAccepted, HTTPBadRequest, HTTPOk, HTTPUnauthorized,
 import vocal.api.operations as op
 import vocal.api.security as security
 import vocal.api.util as util
+import vocal.api.validation as validation
 from vocal.config import AppConfig
 from vocal.api.models.authn import AuthnChallenge, AuthnChallengeResponse
 from vocal.api.models.requests import AuthnChallengeResponseRequest, InitiateAuthnSessionRequest
@@ -12,7 +13,8 @@ from vocal.constants import AuthnChallengeType, AuthnPrincipalType, UserRole
 
 @security.new_session
 async def init_authn_session(request, ctx: AppConfig, session: AuthnSession):
-    sr = InitiateAuthnSessionRequest.unmarshal_request(await request.json())
+    sr = InitiateAuthnSessionRequest.unmarshal_request(
+        await validation.request_body(request, ctx, 'AuthnSessionRequest'))
 
     async with op.session(ctx) as ss:
         if sr.principal_type is AuthnPrincipalType.Email:
@@ -56,7 +58,8 @@ async def verify_authn_challenge(request, ctx: AppConfig, session: AuthnSession)
         raise HTTPBadRequest()
 
     challenge_response =\
-        AuthnChallengeResponseRequest.unmarshal_request(await request.json())
+        AuthnChallengeResponseRequest.unmarshal_request(
+            await validation.request_body(request, ctx, 'AuthnChallengeResponseRequest'))
 
     if challenge_response.challenge_id != session.pending_challenge.challenge_id:
         raise ValueError("invalid challenge")
@@ -1,31 +1,54 @@
 from datetime import datetime
 
-from aiohttp.web import HTTPAccepted, HTTPBadRequest, HTTPUnauthorized, Response
+from aiohttp.web import HTTPAccepted, HTTPBadRequest, HTTPNotFound, HTTPUnauthorized, Response
 
+import vocal.api.cache as cache
 import vocal.api.operations as op
 import vocal.api.security as security
 import vocal.api.util as util
+import vocal.api.validation as validation
 from vocal.config import AppConfig
 from vocal.api.models.user_profile import PaymentProfile
 from vocal.api.models.membership import SubscriptionPlan, Subscription
 from vocal.api.models.requests import CreateSubscriptionPlanRequest, CreateSubscriptionRequest
-from vocal.api.security import AuthnSession, Capability
+from vocal.api.security import AuthnSession, Capability, LazySession
+from vocal.api.storage import replica
 from vocal.constants import PaymentDemandType
 
 
-async def get_subscription_plans(request, ctx: AppConfig, session: AuthnSession):
-    async with op.session(ctx) as ss:
-        plans = await op.membership.\
-            get_subscription_plans().\
-            unmarshal_with(SubscriptionPlan).\
-            execute(ss)
+async def _plans_version(request, ctx: AppConfig) -> str:
+    catalog = ctx.plan_catalog.get()
+    page = util.page_request(request, ctx)
+    if page is None:
+        return await catalog.version(ctx)
+    return f'{await catalog.version(ctx)}:{page.size}:{page.token}'
+
+
+@cache.conditional(cache_control='no-cache', version=_plans_version)
+async def get_subscription_plans(request, ctx: AppConfig, session: LazySession):
+    page = util.page_request(request, ctx)
+    if page is None:
+        # the whole listing is streamed from a server-side cursor, rather than built in memory
+        return _stream_plans(ctx)
 
+    catalog = ctx.plan_catalog.get()
+    plans = await catalog.page(ctx, page)
     return plans.get_view('default')
 
 
+async def _stream_plans(ctx: AppConfig):
+    async with op.session(ctx) as ss:
+        async for plan in op.membership.\
+                get_subscription_plans().\
+                unmarshal_with(SubscriptionPlan).\
+                stream(ss):
+            yield plan.get_view('default')
+
+
 @security.requires(Capability.PlanCreate)
 async def create_subscription_plan(request, ctx: AppConfig, session: AuthnSession):
-    plan = CreateSubscriptionPlanRequest.unmarshal_request(await request.json())
+    plan = CreateSubscriptionPlanRequest.unmarshal_request(
+        await validation.request_body(request, ctx, 'CreateSubscriptionPlanRequest'))
     async with op.session(ctx) as ss:
         pds = []
         for pd in plan.payment_demands:
@@ -47,9 +70,14 @@ async def create_subscription_plan(request, ctx: AppConfig, session: AuthnSessio
 @security.requires(Capability.SubscriptionCreate)
 async def create_subscription(request, ctx: AppConfig, session: AuthnSession):
     subscription_plan_id = request.match_info['subscription_plan_id']
-    subreq = CreateSubscriptionRequest.unmarshal_request(await request.json())
+    subreq = CreateSubscriptionRequest.unmarshal_request(
+        await validation.request_body(request, ctx, 'CreateSubscriptionRequest'))
 
     async with op.session(ctx) as ss:
+        # the plan is read on the primary, in the transaction which subscribes to it, rather
+        # than from the catalog, which may not have seen the latest change to its prices yet
+        replica.mark_written(ss)
+
         # TODO: just use and expand the get_payment_profile method
         profiles = await op.user_profile.\
             get_payment_methods(user_profile_id=session.user_profile_id,
@@ -60,9 +88,12 @@ async def create_subscription(request, ctx: AppConfig, session: AuthnSession):
         pm = pp.payment_methods.find(payment_method_id=subreq.payment_method_id)
 
         plan = await op.membership.\
-            get_subscription_plan(subscription_plan_id=subreq.subscription_plan_id).\
+            get_subscription_plan(subscription_plan_id=subreq.subscription_plan_id,
+                                  default=None).\
             unmarshal_with(SubscriptionPlan).\
             execute(ss)
+        if plan is None:
+            raise HTTPNotFound()
         pd = plan.payment_demands.find(payment_demand_id=subreq.payment_demand_id)
 
         payments = ctx.payments.get()
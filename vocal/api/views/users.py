@@ -5,6 +5,7 @@ from aiohttp.web import HTTPBadRequest, HTTPForbidden, HTTPNotFound, HTTPOk, Req
 import vocal.api.operations as op
 import vocal.api.security as security
 import vocal.api.util as util
+import vocal.api.validation as validation
 from vocal.api.models.authn import AuthnChallenge, AuthnChallengeResponse
 from vocal.api.models.requests import AuthnChallengeResponseRequest, AddPaymentMethodRequest
 from vocal.api.models.user_profile import UserProfile
@@ -54,7 +55,9 @@ async def verify_contact_method(request, ctx: AppConfig, session: AuthnSession):
     except ValueError:
         raise HTTPNotFound()
 
-    challenge_response = AuthnChallengeResponseRequest.unmarshal_request(await request.json())
+    challenge_response = AuthnChallengeResponseRequest.unmarshal_request(
+        await validation.request_body(request, ctx,
+                                      'ContactMethodVerificationChallengeResponseRequest'))
 
     if user_profile_id != session.user_profile_id:
         raise HTTPForbidden()
@@ -90,27 +93,29 @@ async def add_payment_method(request, ctx: AppConfig, session: AuthnSession):
     if user_profile_id != session.user_profile_id:
         raise HTTPForbidden()
 
-    async with op.session(ctx) as ss:
-        # fail if user's email address is not verified
-        u = await op.user_profile.get_user_profile(user_profile_id=user_profile_id).execute(ss)
-        if not u.email_contact_method_verified:
-            raise ValueError("email address must be verified first")
-
-        addpmrq = AddPaymentMethodRequest.unmarshal_request(await request.json())
-        payments = ctx.payments.get()
-        processor = payments[addpmrq.processor_id]
-
-        pp = await op.user_profile.\
-            get_payment_profile(user_profile_id=user_profile_id,
-                                processor_id=addpmrq.processor_id).\
-            execute(ss)
-
-        if pp is not None:
-            pp_id = pp.payment_profile_id
-            cust_id = pp.processor_customer_profile_id
-        else:
-            cust_id = await processor.create_customer_profile(
-                u.user_profile_id, u.name, u.email_address, u.phone_number, address=None)
+    addpmrq = AddPaymentMethodRequest.unmarshal_request(
+        await validation.request_body(request, ctx, 'AddPaymentMethodRequest'))
+    payments = ctx.payments.get()
+    processor = payments[addpmrq.processor_id]
+
+    # the user and their payment profile are independent reads, so they are made concurrently
+    u, pp = await op.execute(ctx, [
+        op.user_profile.get_user_profile(user_profile_id=user_profile_id),
+        op.user_profile.get_payment_profile(user_profile_id=user_profile_id,
+                                            processor_id=addpmrq.processor_id),
+    ], batch=True)
+
+    # fail if user's email address is not verified
+    if not u.email_contact_method_verified:
+        raise ValueError("email address must be verified first")
+
+    if pp is not None:
+        pp_id = pp.payment_profile_id
+        cust_id = pp.processor_customer_profile_id
+    else:
+        cust_id = await processor.create_customer_profile(
+            u.user_profile_id, u.name, u.email_address, u.phone_number, address=None)
+        async with op.session(ctx) as ss:
             pp_id = await op.user_profile.\
                 add_payment_profile(
                     user_profile_id=u.user_profile_id,
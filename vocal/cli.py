@@ -1,7 +1,9 @@
 import asyncio
 import logging
 import pdb
+import signal
 import traceback
+from functools import partial
 from pathlib import Path
 from importlib import import_module
 
@@ -12,29 +14,39 @@ import sqlalchemy
 
 import vocal.config
 import vocal.log
-from vocal.util.asyncio import synchronously
+from vocal.util.asyncio import LoopPolicies, install_loop_policy, synchronously
+from vocal.util.prefork import Supervisor
 
 
 base_path = Path(__file__).parent.parent
 
 
+def loop_policy(ctx, param, value):
+    # installed while the options are parsed, before the loop which runs the command exists
+    return value, install_loop_policy(value)
+
+
 @click.group()
 @click.option('-D', '--debug', is_flag=True, default=False)
 @click.option('-C', '--config_path', default=None)
 @click.option('-E', '--env', default='dev')
+@click.option('-L', '--loop', 'loop_policy', type=click.Choice(LoopPolicies),
+              default='asyncio', envvar='VOCAL_LOOP', is_eager=True, callback=loop_policy,
+              help="event loop implementation; asyncio is used if uvloop is not installed")
 @click.argument('app_path')
 @click.pass_context
 @synchronously(pass_loop=True)
-async def main(loop, ctx, debug, config_path, env, app_path):
+async def main(loop, ctx, debug, config_path, env, loop_policy, app_path):
     try:
         loop.set_debug(debug)
-        appctx = vocal.config.AppConfig('debug', 'config', 'module')
+        appctx = vocal.config.AppConfig('debug', 'config', 'module', 'config_source')
 
         if config_path is None:
             config_path = base_path / 'config' / app_path
         if ctx.obj is None:
             ctx.obj = appctx
 
+        appctx.config_source.set((config_path, env))
         appctx.config.set(await vocal.config.load_config(config_path, env))
         appctx.module.set(import_module(app_path))
 
@@ -44,6 +56,10 @@ async def main(loop, ctx, debug, config_path, env, app_path):
         appctx.debug.set(debug)
         if debug:
             logger.info('debugging mode enabled')
+
+        requested, installed = loop_policy
+        if requested != installed:
+            logger.warning(f"{requested} is not installed, using the {installed} event loop")
         assert appctx.ready
     except Exception:
         if debug:
@@ -53,25 +69,83 @@ async def main(loop, ctx, debug, config_path, env, app_path):
 
 
 @main.command()
+@click.option('-w', '--workers', default=1, type=int,
+              help="number of worker processes, which share the port with SO_REUSEPORT")
 @click.pass_obj
-def serve(appctx):
-    loop = asyncio.get_event_loop()
+def serve(appctx, workers):
     logger = logging.getLogger(__name__)
-    mod = appctx.module.get()
     config = appctx.config.get()
 
-    async def setup_app(appctx, module):
-        await mod.configure(appctx)
-        return await module.initialize(appctx)
-
-    app = loop.run_until_complete(setup_app(appctx, mod))
     appconf = config['app'].copy()
     appname = appconf.pop('name')
 
+    if workers > 1:
+        # each worker configures the app itself, so that it has its own pools and connections
+        logger.info(f"starting {appname} with {workers} workers")
+        Supervisor(partial(serve_worker, appctx), workers).run()
+        return
+
+    loop = asyncio.get_event_loop()
+    app = loop.run_until_complete(setup_app(appctx))
+
     logger.info(f"starting {appname}")
     loop.run_until_complete(aiohttp.web.run_app(app, **appconf))
 
 
+async def setup_app(appctx) -> aiohttp.web.Application:
+    module = appctx.module.get()
+    await module.configure(appctx)
+    return await module.initialize(appctx)
+
+
+SiteOptions = ('host', 'port', 'shutdown_timeout', 'ssl_context', 'backlog', 'reuse_address')
+
+
+async def reload_context(appctx) -> vocal.config.AppConfig:
+    """
+    Returns a context like `appctx`, but with the configuration loaded afresh from where
+    `appctx`'s was, so that the workers a SIGHUP starts pick up changes to it. Code is not
+    reloaded: that takes restarting the supervisor.
+    """
+    config_path, env = appctx.config_source.get()
+    workerctx = vocal.config.AppConfig('debug', 'config', 'module', 'config_source')
+    workerctx.debug.set(appctx.debug.get())
+    workerctx.module.set(appctx.module.get())
+    workerctx.config_source.set((config_path, env))
+    workerctx.config.set(await vocal.config.load_config(config_path, env))
+    await vocal.log.configure(workerctx)
+    return workerctx
+
+
+def serve_worker(appctx, ready):
+    "Serves the app in a worker process of `serve --workers`, until SIGTERM or SIGINT."
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    appctx = loop.run_until_complete(reload_context(appctx))
+    appconf = appctx.config.get()['app'].copy()
+    appconf.pop('name')
+    siteconf = {k: v for k, v in appconf.items() if k in SiteOptions}
+    runnerconf = {k: v for k, v in appconf.items() if k not in SiteOptions}
+
+    app = loop.run_until_complete(setup_app(appctx))
+    runner = aiohttp.web.AppRunner(app, handle_signals=False, **runnerconf)
+    loop.run_until_complete(runner.setup())
+    site = aiohttp.web.TCPSite(runner, reuse_port=True, **siteconf)
+    loop.run_until_complete(site.start())
+
+    stopped = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stopped.set)
+    ready()
+
+    try:
+        loop.run_until_complete(stopped.wait())
+    finally:
+        loop.run_until_complete(runner.cleanup())
+        loop.close()
+
+
 @main.group()
 @click.pass_obj
 def database(appctx):
@@ -13,3 +13,27 @@ def synchronously(f=None, pass_loop=False, loop_getter=asyncio.get_event_loop):
             args = (loop,) + args
         return loop.run_until_complete(f(*args, **kwargs))
     return run
+
+
+LoopPolicies = ('asyncio', 'uvloop')
+
+
+def install_loop_policy(name: str) -> str:
+    """
+    Installs the event loop policy `name`, one of `LoopPolicies`, for loops created from now on.
+    Returns the name of the policy installed, which is `asyncio` if uvloop is not installed.
+    """
+    if name not in LoopPolicies:
+        raise ValueError(f"unsupported event loop policy: {name}")
+
+    if name == 'uvloop':
+        try:
+            import uvloop
+        except ImportError:
+            name = 'asyncio'
+        else:
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+            return name
+
+    asyncio.set_event_loop_policy(None)
+    return name
@@ -0,0 +1,100 @@
+from collections.abc import Sequence
+from typing import Any, Callable, Optional
+
+
+class IndexedSequence(Sequence):
+    """
+    A sequence of objects which answers `find()`, `find_all()` and `group_by()` from hash
+    indexes on the objects' attributes. The index on an attribute is built the first time it is
+    looked up, and kept up to date by `append()`.
+
+    Attributes whose values are unhashable are matched by a linear scan instead.
+    """
+
+    def __init__(self, items: Optional[list]=None):
+        self._items = items if items is not None else []
+        self._indexes = {}
+
+    def __len__(self):
+        return self._items.__len__()
+
+    def __getitem__(self, index):
+        return self._items.__getitem__(index)
+
+    def append(self, item):
+        self._items.append(item)
+        for name, index in self._indexes.items():
+            if index is not None:
+                try:
+                    index.setdefault(getattr(item, name), []).append(item)
+                except TypeError:
+                    self._indexes[name] = None
+
+    def index_on(self, name: str) -> Optional[dict[Any, list]]:
+        "Returns the index on attribute `name`, or `None` if its values are unhashable."
+        try:
+            return self._indexes[name]
+        except KeyError:
+            pass
+
+        index = {}
+        try:
+            for item in self._items:
+                index.setdefault(getattr(item, name), []).append(item)
+        except TypeError:
+            index = None
+        self._indexes[name] = index
+        return index
+
+    def group_by(self, name: str) -> dict[Any, list]:
+        "Groups the items by attribute `name`. The result is shared and must not be modified."
+        index = self.index_on(name)
+        if index is None:
+            raise TypeError(f"cannot group by unhashable attribute: {name}")
+        return index
+
+    def find(self, keyf: Callable[[Any], bool]=None, **kwargs):
+        if keyf is not None:
+            for item in self._items:
+                if keyf(item):
+                    return item
+            return None
+
+        elif kwargs:
+            matches = self._match(kwargs)
+            return matches[0] if matches else None
+
+        raise RuntimeError("find() must be called with key function or kwargs")
+
+    def find_all(self, keyf: Callable[[Any], bool]=None, **kwargs):
+        if keyf is not None:
+            return [item for item in self._items if keyf(item)]
+
+        elif kwargs:
+            return list(self._match(kwargs))
+
+        raise RuntimeError("find_all() must be called with key function or kwargs")
+
+    def _match(self, kwargs: dict[str, Any]) -> list:
+        candidates = None
+        rest = []
+        for name, value in kwargs.items():
+            if candidates is None:
+                index = self.index_on(name)
+                if index is not None:
+                    try:
+                        candidates = index.get(value, [])
+                        continue
+                    except TypeError:
+                        pass
+            rest.append((name, value))
+
+        if candidates is None:
+            candidates = self._items
+        if not rest:
+            return candidates
+        return [item for item in candidates
+                if all(getattr(item, name) == value for name, value in rest)]
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self._items}>"
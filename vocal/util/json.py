@@ -6,8 +6,6 @@ import uuid
 
 import psycopg2.extras
 
-from vocal.api.message import ResultMessage
-
 
 class JsonEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -32,5 +30,10 @@ class JsonEncoder(json.JSONEncoder):
         return json.JSONEncoder.default(self, obj)
 
 
-def encode(obj):
+def encode(obj) -> str:
     return json.dumps(obj, cls=JsonEncoder)
+
+
+def encode_bytes(obj) -> bytes:
+    # json.dumps escapes every non-ASCII character
+    return encode(obj).encode('ascii')
@@ -0,0 +1,44 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class LRUCache(object):
+    """
+    A mapping of at most `max_size` entries, each of which expires `ttl` seconds after it was
+    set. Setting an entry in a full cache evicts the least recently used one.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        if max_size < 1:
+            raise ValueError(f"max_size must be positive: {max_size}")
+        self._max_size = max_size
+        self._ttl = ttl
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any=None) -> Any:
+        try:
+            expires_at, value = self._entries[key]
+        except KeyError:
+            return default
+
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return default
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        self._entries[key] = (time.monotonic() + self._ttl, value)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any=None) -> Any:
+        return self._entries.pop(key, (None, default))[1]
+
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,158 @@
+import logging
+import os
+import select
+import signal
+import time
+from typing import Callable
+
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerFailed(Exception):
+    pass
+
+
+class Supervisor(object):
+    """
+    Runs `workers` forked processes, each of which calls `target(ready)` and exits when it
+    returns. A worker calls `ready()` once it is serving, and must return promptly on SIGTERM.
+
+    A worker which exits without being asked to is replaced. On SIGHUP the workers are replaced
+    one at a time, each new worker being ready before the worker it replaces is stopped, so that
+    some workers are always serving. SIGTERM and SIGINT stop every worker and then the
+    supervisor.
+    """
+
+    def __init__(self, target: Callable[[Callable[[], None]], None], workers: int,
+                 ready_timeout: float=60.0, stop_timeout: float=60.0, restart_delay: float=1.0):
+        if workers < 1:
+            raise ValueError(f"at least one worker is required: {workers}")
+        self._target = target
+        self._workers = workers
+        self._ready_timeout = ready_timeout
+        self._stop_timeout = stop_timeout
+        self._restart_delay = restart_delay
+        self._pids = {}
+        self._stopping = False
+        self._reloading = False
+
+    def run(self):
+        handlers = {sig: signal.signal(sig, self._signalled)
+                    for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP)}
+        try:
+            for _ in range(self._workers):
+                self._start_ready()
+            while not self._stopping:
+                if self._reloading:
+                    self._reloading = False
+                    self._reload()
+                self._reap()
+                self._replenish()
+                time.sleep(0.2)
+        finally:
+            self._stop(list(self._pids))
+            for sig, handler in handlers.items():
+                signal.signal(sig, handler)
+
+    def _signalled(self, signum, frame):
+        if signum == signal.SIGHUP:
+            self._reloading = True
+        else:
+            self._stopping = True
+
+    def _spawn(self) -> tuple[int, int]:
+        r, w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(r)
+            for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+                signal.signal(sig, signal.SIG_DFL)
+            status = 0
+            try:
+                self._target(lambda: os.write(w, b'1'))
+            except BaseException:
+                logger.exception(f"worker {os.getpid()} failed")
+                status = 1
+            finally:
+                logging.shutdown()
+                os._exit(status)
+
+        os.close(w)
+        self._pids[pid] = time.monotonic()
+        return pid, r
+
+    def _start_ready(self) -> int:
+        "Starts a worker and waits for it to be ready."
+        pid, r = self._spawn()
+        try:
+            readable, _, _ = select.select([r], [], [], self._ready_timeout)
+            if not readable or os.read(r, 1) != b'1':
+                self._stop([pid])
+                raise WorkerFailed(f"worker {pid} did not become ready")
+        finally:
+            os.close(r)
+        logger.info(f"worker {pid} is ready")
+        return pid
+
+    def _reap(self):
+        while self._pids:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            started_at = self._pids.pop(pid, None)
+            if started_at is None or self._stopping:
+                continue
+
+            logger.warning(f"worker {pid} exited with status {status}")
+            # don't restart a worker which cannot start as fast as it can fail
+            if time.monotonic() - started_at < self._restart_delay:
+                time.sleep(self._restart_delay)
+
+    def _replenish(self):
+        while len(self._pids) < self._workers and not self._stopping:
+            try:
+                self._start_ready()
+            except WorkerFailed as e:
+                logger.error(str(e))
+                time.sleep(self._restart_delay)
+                return
+
+    def _reload(self):
+        logger.info("replacing workers")
+        for pid in list(self._pids):
+            if self._stopping:
+                return
+            try:
+                self._start_ready()
+            except WorkerFailed as e:
+                logger.error(f"{e}, keeping the remaining workers")
+                return
+            self._stop([pid])
+
+    def _stop(self, pids: list[int]):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+        deadline = time.monotonic() + self._stop_timeout
+        for pid in pids:
+            while True:
+                try:
+                    done, _ = os.waitpid(pid, os.WNOHANG)
+                except ChildProcessError:
+                    break
+                if done:
+                    break
+                if time.monotonic() > deadline:
+                    logger.warning(f"worker {pid} did not stop, killing it")
+                    os.kill(pid, signal.SIGKILL)
+                    os.waitpid(pid, 0)
+                    break
+                time.sleep(0.1)
+            self._pids.pop(pid, None)
@@ -0,0 +1,229 @@
+import decimal
+import uuid
+from typing import Any, Callable, Optional
+
+
+class SchemaError(ValueError):
+    def __init__(self, reason: str, path: Optional[list]=None):
+        super().__init__(reason)
+        self.reason = reason
+        self.path = path or []
+
+    def __str__(self):
+        if not self.path:
+            return self.reason
+        return f"{'.'.join(str(p) for p in self.path)}: {self.reason}"
+
+
+def _uuid(v: str) -> uuid.UUID:
+    return uuid.UUID(v)
+
+
+def _decimal(v: str) -> decimal.Decimal:
+    d = decimal.Decimal(v)
+    if not d.is_finite():
+        raise ValueError(v)
+    return d
+
+
+# conversions of a string in a `format` to its value, which raise ValueError if the string is not
+# in the format; strings in other formats are neither checked nor converted
+formats = {
+    'uuid': _uuid,
+    'decimal': _decimal,
+}
+
+
+def _merge(v, converted, other):
+    """
+    Returns `converted`, a conversion of `v`, with the conversions of `other`, another one, laid
+    over it; `allOf` converts a value once for each of its schemas.
+    """
+    if other is v:
+        return converted
+    if converted is v or not isinstance(other, dict):
+        return other
+    return {**converted, **{k: x for k, x in other.items() if x is not v.get(k)}}
+
+_types = {
+    'object': ("isinstance({v}, dict)", "an object"),
+    'array': ("isinstance({v}, list)", "an array"),
+    'string': ("isinstance({v}, str)", "a string"),
+    'integer': ("(type({v}) is int)", "an integer"),
+    'number': ("(type({v}) in (int, float))", "a number"),
+    'boolean': ("({v} is True or {v} is False)", "a boolean"),
+}
+
+
+def compile_schema(schema: dict, resolve: Callable[[str], dict]=None,
+                   name: str='validate') -> Callable[[Any], Any]:
+    """
+    Compiles an OpenAPI schema into a function which checks a decoded JSON document against it
+    and returns the document with the strings in the formats of `formats` converted to their
+    values, or raises `SchemaError` naming where the document does not match. Only the objects
+    and arrays holding converted values are copied; the document passed in is not changed.
+
+    The checks are generated as Python source, specialized to the schema, so that validating a
+    document costs no interpretation of the schema. `resolve` returns the schema a `$ref`
+    refers to. `type`, `nullable`, `enum`, `format`, `required`, `properties`,
+    `additionalProperties: false`, `items`, `minItems`, `maxItems`, `minLength`, `maxLength`,
+    `minimum`, `maximum`, `allOf` and `oneOf` are supported; other keywords are ignored.
+    """
+    c = _compiler(resolve)
+    entry = c.function(schema)
+    source = '\n'.join(c.lines) + f"\ndef {name}(v):\n    return {entry}(v)\n"
+    ns = dict(c.consts, SchemaError=SchemaError, _merge=_merge)
+    exec(compile(source, f'<schema {name}>', 'exec'), ns)
+    return ns[name]
+
+
+class _compiler(object):
+    def __init__(self, resolve: Optional[Callable[[str], dict]]):
+        self.resolve = resolve
+        self.lines = []
+        self.consts = {}
+        self.refs = {}
+        self.functions = 0
+
+    def const(self, value) -> str:
+        name = f'_c{len(self.consts)}'
+        self.consts[name] = value
+        return name
+
+    def function(self, schema: dict) -> str:
+        "Emits a function checking `schema` and returns its name."
+        ref = schema.get('$ref')
+        if ref is None:
+            name = self.function_name()
+            self.emit(name, schema)
+            return name
+
+        if ref not in self.refs:
+            if self.resolve is None:
+                raise ValueError(f"cannot resolve {ref}")
+            # named before it is emitted, so that a recursive schema refers to itself
+            name = self.refs[ref] = self.function_name()
+            self.emit(name, self.resolve(ref))
+        return self.refs[ref]
+
+    def function_name(self) -> str:
+        self.functions += 1
+        return f'_s{self.functions}'
+
+    def emit(self, name: str, schema: dict):
+        body = []
+        self.checks(schema, 'v', body, '    ')
+        body.append('    return v')
+        self.lines.append(f"def {name}(v):\n" + '\n'.join(body))
+
+    def checks(self, schema: dict, v: str, out: list, indent: str):
+        if '$ref' in schema:
+            out.append(f"{indent}{v} = {self.function(schema)}({v})")
+            return
+
+        if schema.get('nullable'):
+            out.append(f"{indent}if {v} is not None:")
+            indent += '    '
+            out.append(f"{indent}pass")
+
+        t = schema.get('type')
+        if t is not None:
+            test, what = _types[t]
+            out.append(f"{indent}if not {test.format(v=v)}:")
+            out.append(f"{indent}    raise SchemaError('expected {what}')")
+
+        if 'enum' in schema:
+            values = self.const(frozenset(schema['enum']))
+            # an object or array is never one of the values, and cannot be looked up in them
+            out.append(f"{indent}try:")
+            out.append(f"{indent}    _valid = {v} in {values}")
+            out.append(f"{indent}except TypeError:")
+            out.append(f"{indent}    _valid = False")
+            out.append(f"{indent}if not _valid:")
+            out.append(f"{indent}    raise SchemaError('must be one of ' + "
+                       f"{', '.join(map(str, schema['enum']))!r})")
+
+        for key, op, what in (('minLength', '<', 'shorter than'),
+                              ('maxLength', '>', 'longer than'),
+                              ('minItems', '<', 'fewer items than'),
+                              ('maxItems', '>', 'more items than')):
+            if key in schema:
+                out.append(f"{indent}if len({v}) {op} {int(schema[key])}:")
+                out.append(f"{indent}    raise SchemaError('{what} {int(schema[key])}')")
+
+        convert = formats.get(schema.get('format'))
+        if convert is not None:
+            out.append(f"{indent}try:")
+            out.append(f"{indent}    {v} = {self.const(convert)}({v})")
+            out.append(f"{indent}except (TypeError, ValueError, ArithmeticError):")
+            out.append(f"{indent}    raise SchemaError('not a valid {schema['format']}') "
+                       f"from None")
+        for key, op, what in (('minimum', '<', 'less than'), ('maximum', '>', 'greater than')):
+            if key in schema:
+                out.append(f"{indent}if {v} {op} {schema[key]!r}:")
+                out.append(f"{indent}    raise SchemaError('{what} {schema[key]}')")
+
+        for name in schema.get('required', ()):
+            out.append(f"{indent}if {name!r} not in {v}:")
+            out.append(f"{indent}    raise SchemaError('is required', [{name!r}])")
+
+        properties = schema.get('properties', {})
+        # an object or array is copied when the first of its values is converted
+        if properties:
+            out.append(f"{indent}_object = {v}")
+        for name, prop in properties.items():
+            f = self.function(prop)
+            out.append(f"{indent}if {name!r} in {v}:")
+            out.append(f"{indent}    try:")
+            out.append(f"{indent}        x = {f}({v}[{name!r}])")
+            out.append(f"{indent}    except SchemaError as e:")
+            out.append(f"{indent}        e.path.insert(0, {name!r})")
+            out.append(f"{indent}        raise")
+            out.append(f"{indent}    if x is not {v}[{name!r}]:")
+            out.append(f"{indent}        if {v} is _object:")
+            out.append(f"{indent}            {v} = dict({v})")
+            out.append(f"{indent}        {v}[{name!r}] = x")
+        if schema.get('additionalProperties') is False:
+            names = self.const(frozenset(properties))
+            out.append(f"{indent}for k in {v}:")
+            out.append(f"{indent}    if k not in {names}:")
+            out.append(f"{indent}        raise SchemaError('is not allowed', [k])")
+
+        if 'items' in schema:
+            f = self.function(schema['items'])
+            out.append(f"{indent}_items = None")
+            out.append(f"{indent}for i, x in enumerate({v}):")
+            out.append(f"{indent}    try:")
+            out.append(f"{indent}        y = {f}(x)")
+            out.append(f"{indent}    except SchemaError as e:")
+            out.append(f"{indent}        e.path.insert(0, i)")
+            out.append(f"{indent}        raise")
+            out.append(f"{indent}    if y is not x:")
+            out.append(f"{indent}        if _items is None:")
+            out.append(f"{indent}            _items = list({v})")
+            out.append(f"{indent}        _items[i] = y")
+            out.append(f"{indent}if _items is not None:")
+            out.append(f"{indent}    {v} = _items")
+
+        if 'allOf' in schema:
+            # each schema is given the value as it was, as it may not accept converted values
+            out.append(f"{indent}_given = {v}")
+            for sub in schema['allOf']:
+                out.append(f"{indent}{v} = _merge(_given, {v}, {self.function(sub)}(_given))")
+
+        if 'oneOf' in schema:
+            fs = '(' + ''.join(self.function(sub) + ', ' for sub in schema['oneOf']) + ')'
+            errors = f'_e{self.functions}'
+            out.append(f"{indent}{errors} = []")
+            out.append(f"{indent}_given = {v}")
+            out.append(f"{indent}for f in {fs}:")
+            out.append(f"{indent}    try:")
+            out.append(f"{indent}        {v} = f(_given)")
+            out.append(f"{indent}    except SchemaError as e:")
+            out.append(f"{indent}        {errors}.append(e)")
+            out.append(f"{indent}if len({errors}) != {len(schema['oneOf']) - 1}:")
+            out.append(f"{indent}    if len({errors}) == {len(schema['oneOf'])}:")
+            out.append(f"{indent}        raise SchemaError('matches none of the allowed "
+                       f"schemas: ' + '; '.join(map(str, {errors})))")
+            out.append(f"{indent}    raise SchemaError('matches more than one of the allowed "
+                       f"schemas')")
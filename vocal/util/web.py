@@ -1,11 +1,9 @@
 import json
 from functools import wraps, partial
 
-import aiohttp_session
 import aiohttp.web as web
 
 from .json import JsonEncoder
-from vocal.api.message import ResultMessage
 
 
 def json_response(handler=None, encoder_cls=JsonEncoder):
@@ -23,9 +21,3 @@ def json_response(handler=None, encoder_cls=JsonEncoder):
         else:
             return web.json_response(resp, status=200, dumps=encode)
     return f
-
-
-@web.middleware
-async def json_response_middleware(request, handler):
-    wrapper = json_response(handler)
-    return await wrapper(request)